@@ -0,0 +1,84 @@
+"""Measure cold import time of the bot's modules.
+
+Every module is imported in a fresh interpreter, so the numbers do not depend on what
+was imported before. The slowest individual imports of the full bot come from
+``python -X importtime``.
+
+Usage: python benchmarks/startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "config",
+    "services.db",
+    "services.http",
+    "services.media_probe",
+    "loader",
+    "main",
+    "middlewares",
+    "handlers",
+]
+
+TIMER = """
+import time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+{init}
+print(imported - start, time.perf_counter() - imported)
+"""
+
+# Work done after import on startup that does not touch the network
+INIT = {
+    "services.db": "services.db.DataBase()",
+    "handlers": "import loader; loader.dp.include_router(handlers.router)",
+}
+
+
+def measure(module):
+    script = TIMER.format(module=module, init=INIT.get(module, ""))
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    import_time, init_time = map(float, result.stdout.split())
+    return import_time, init_time
+
+
+def slowest_imports(module, count=15):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print(f"{'module':<22} {'import ms':>10} {'init ms':>9}")
+    for module in MODULES:
+        try:
+            samples = [measure(module) for _ in range(runs)]
+        except RuntimeError as e:
+            print(f"{module:<22} failed: {e}")
+            continue
+        import_ms = statistics.median(s[0] for s in samples) * 1000
+        init_ms = statistics.median(s[1] for s in samples) * 1000
+        print(f"{module:<22} {import_ms:10.1f} {init_ms:9.1f}")
+
+    print("\nslowest imports of handlers (self time):")
+    for self_us, cumulative_us, name in slowest_imports("handlers"):
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Compare the MP4 header probe with moviepy's VideoFileClip for reading video size.
+
+Usage: python benchmarks/video_probe.py path/to/video.mp4 [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.media_probe import probe_mp4  # noqa: E402
+
+
+def bench(name, func, iterations):
+    result = func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"{name:<14} {elapsed * 1000:10.3f} ms/call  -> {result}")
+    return elapsed
+
+
+def moviepy_size(path):
+    from moviepy.editor import VideoFileClip
+
+    with VideoFileClip(path) as clip:
+        return tuple(clip.size), round(clip.duration)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[1]
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    probe = bench("mp4 probe", lambda: probe_mp4(path), iterations)
+    clip = bench("VideoFileClip", lambda: moviepy_size(path), iterations)
+    print(f"speedup: {clip / probe:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,101 @@ MEASUREMENT_ID = str(os.getenv("MEASUREMENT_ID"))
 API_SECRET = str(os.getenv("API_SECRET"))
 OUTPUT_DIR = "downloads"
 
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_RETRY_ATTEMPTS = 3
+DB_RETRY_DELAY = 1  # seconds, multiplied by the attempt number
+
+FILE_CACHE_SIZE = int(os.getenv("FILE_CACHE_SIZE", 10_000))
+FILE_CACHE_TTL = int(os.getenv("FILE_CACHE_TTL", 24 * 60 * 60))
+FILE_BLOOM_CAPACITY = int(os.getenv("FILE_BLOOM_CAPACITY", 1_000_000))
+FILE_BLOOM_ERROR_RATE = 0.01
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10_000))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 5 * 60))
+
+USER_UPDATE_FLUSH_INTERVAL = 5  # seconds
+USER_UPDATE_BATCH_SIZE = 500
+
+# Bot API allows about 30 messages per second to different chats
+BROADCAST_RATE = 25  # messages per second
+BROADCAST_CONCURRENCY = 25
+BROADCAST_BATCH_SIZE = 500  # progress is checkpointed after every batch
+BROADCAST_PROGRESS_INTERVAL = 5  # seconds between progress message edits
+
+# Extra Instagram accounts as "login:password,login2:password2"; INST_LOGIN is always used
+INST_ACCOUNTS = [(INST_LOGIN, INST_PASS)] + [
+    tuple(account.split(":", 1)) for account in os.getenv("INST_ACCOUNTS", "").split(",") if ":" in account
+]
+INST_REQUEST_BUDGET = 100  # requests per account per INST_BUDGET_WINDOW
+INST_BUDGET_WINDOW = 60 * 60  # seconds
+INST_HEALTH_CHECK_INTERVAL = 15 * 60  # seconds
+INST_THROTTLE_COOLDOWN = 10 * 60  # seconds
+INST_ACQUIRE_TIMEOUT = 30  # seconds a request may wait for a free account
+
+# Source metadata; media URLs in it are signed and expire, so TTLs stay below their lifetime
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", 2_000))
+METADATA_CACHE_TTL = {
+    'youtube': 60 * 60,
+    'instagram': 30 * 60,
+    'tiktok': 6 * 60 * 60,
+    'twitter': 24 * 60 * 60,
+}
+METADATA_CACHE_DEFAULT_TTL = 30 * 60
+METADATA_CACHE_PATH = os.getenv("METADATA_CACHE_PATH")  # unset: memory only
+
+# Цілі коротких посилань однакові для всіх, тож зберігаються в пам'яті та в таблиці short_links
+SHORT_LINK_CACHE_SIZE = int(os.getenv("SHORT_LINK_CACHE_SIZE", 10_000))
+SHORT_LINK_TTL = int(os.getenv("SHORT_LINK_TTL", 7 * 24 * 60 * 60))
+SHORT_LINK_MAX_REDIRECTS = 5
+
+# Робочі каталоги завантажень у OUTPUT_DIR та спільний ліміт диска для них
+SCRATCH_BUDGET = int(os.getenv("SCRATCH_BUDGET_MB", 4096)) * 1024 * 1024
+SCRATCH_DEFAULT_SIZE = 50 * 1024 * 1024  # reserved when a job's size is not known in advance
+SCRATCH_ORPHAN_AGE = 3600  # seconds
+SCRATCH_SWEEP_INTERVAL = 600  # seconds
+
+# Недавно завантажені відео, з яких кнопка MP3 вирізає аудіо без повторного завантаження
+MEDIA_STORE_DIR = os.path.join(OUTPUT_DIR, "recent")
+MEDIA_STORE_TTL = int(os.getenv("MEDIA_STORE_TTL", 900))  # seconds
+MEDIA_STORE_MAX_BYTES = int(os.getenv("MEDIA_STORE_MAX_MB", 2048)) * 1024 * 1024
+MEDIA_STORE_SWEEP_INTERVAL = 60  # seconds
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY")  # unset: ffmpeg from PATH or the one bundled with moviepy
+
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", 8))
+PLATFORM_CONCURRENCY = {
+    'youtube': int(os.getenv("YOUTUBE_CONCURRENCY", 2)),
+    'tiktok': int(os.getenv("TIKTOK_CONCURRENCY", 4)),
+    'instagram': int(os.getenv("INSTAGRAM_CONCURRENCY", 2)),
+    'twitter': int(os.getenv("TWITTER_CONCURRENCY", 4)),
+}
+HTTP2_ENABLED = True
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 60
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY = 30
+HTTP_PER_HOST_CONCURRENCY = 4
+
+MEDIA_FETCH_CONCURRENCY = 8
+MEDIA_FETCH_RETRIES = 2
+MEDIA_FETCH_RETRY_DELAY = 0.5  # seconds, doubled on every retry
+
+# Streaming uploads keep at most this much of the body in memory to find the MP4 header
+STREAM_HEADER_LIMIT = 2 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+BOT_IDENTITY_REFRESH_INTERVAL = 60 * 60  # seconds
+
+ANALYTICS_MAX_QUEUE = 10_000
+ANALYTICS_BATCH_SIZE = 100
+ANALYTICS_FLUSH_INTERVAL = 10  # seconds
+
+# Used to order the download queue: a job's size is converted to seconds of "head start"
+SCHEDULER_BYTES_PER_SECOND = 10 * 1024 * 1024
+SCHEDULER_DEFAULT_SIZE = 50 * 1024 * 1024
+
 BOT_COMMANDS = [
     {'command': 'start', 'description': '🚀Початок роботи / Get started🔥'},
     {'command': 'settings', 'description': '⚙️Налаштування / Settings🛠'},
@@ -5,7 +5,7 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from main import bot, db
+from loader import bot, broadcaster, db, scheduler
 from filters import IsBotAdmin
 import keyboards as kb
 import messages as bm
@@ -35,13 +35,21 @@ async def admin(message: types.Message):
         inactive_user_count = await db.inactive_user_count()
 
         await message.answer(
-            text=bm.admin_panel(user_count, active_user_count, inactive_user_count), reply_markup=kb.admin_keyboard(),
+            text=bm.admin_panel(user_count, active_user_count, inactive_user_count, db.file_cache.stats(),
+                                scheduler.stats()),
+            reply_markup=kb.admin_keyboard(),
             parse_mode='HTML')
 
     else:
         await message.answer(bm.not_groups())
 
 
+@router.message(Command("backfill_stats"), IsBotAdmin())
+async def backfill_stats(message: types.Message):
+    await db.backfill_download_stats()
+    await message.answer(bm.stats_rebuilt())
+
+
 @router.callback_query(F.data == 'back_to_admin')
 async def back_to_admin(call: types.CallbackQuery):
     await bot.delete_message(call.message.chat.id, call.message.message_id)
@@ -72,34 +80,9 @@ async def send_to_all_message(message: types.Message, state: FSMContext):
                                text=bm.start_mailing(),
                                reply_markup=types.ReplyKeyboardRemove())
 
-        users = await db.all_users()
-        for user in users:
-            try:
-                await bot.forward_message(chat_id=user[0],
-                                          from_chat_id=sender_id,
-                                          message_id=message.message_id)
-
-                user_status = await db.status(user[0])
-
-                if user_status == "inactive":
-                    await db.set_active(user[0])
-
-                await asyncio.sleep(
-                    0.05
-                )
-
-            except Exception as e:
-
-                if str(e) == "Forbidden: bots can't send messages to bots":
-                    await db.delete_user(user[0])
-
-                if "blocked" or "Chat not found" in str(e):
-                    await db.set_inactive(user[0])
-                continue
-
-        await bot.send_message(chat_id=message.chat.id,
-                               text=bm.finish_mailing(),
-                               reply_markup=types.ReplyKeyboardRemove())
+        # Розсилка зберігає прогрес у БД і продовжиться після перезапуску
+        mailing = await db.create_mailing(message.chat.id, sender_id, message.message_id)
+        await broadcaster.run(mailing)
         return
 
 
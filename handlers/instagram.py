@@ -1,71 +1,79 @@
 import asyncio
 import os
 import re
+from typing import List, NamedTuple, Optional, Tuple
 
-import instaloader
 from aiogram import Router, F, types
 from aiogram.types import FSInputFile
 from aiogram.utils.media_group import MediaGroupBuilder
-from moviepy.editor import VideoFileClip
 
 import messages as bm
-from config import OUTPUT_DIR, INST_PASS, INST_LOGIN, admin_id
+from config import admin_id
 from handlers.user import update_info
-from main import bot, db, send_analytics
+from helper import run_download_job, stream_video, DownloadError
+from loader import bot, db, in_flight, instagram_sessions, metadata, scratch, send_analytics
+from services import http
+from services.db import UserProfile
+from services.media_key import resolve_media_key
+
+MAX_FILE_SIZE = 500 * 1024 * 1024
 
 router = Router()
 
-L = instaloader.Instaloader()
 
+@router.message(F.text.startswith("/ig_code "), F.from_user.id == admin_id)
+async def submit_instagram_code(message: types.Message):
+    # Код 2FA для логіну, який на нього чекає в менеджері сесій
+    if not instagram_sessions.submit_code(message.text.split(" ", 1)[1].strip()):
+        await message.reply("No Instagram login is waiting for a code.")
 
-# Асинхронне очікування коду двофакторної автентифікації
-async def wait_for_code(admin_id):
-    code_future = asyncio.Future()
 
-    # Надсилаємо повідомлення адміну з проханням ввести код
-    await bot.send_message(chat_id=admin_id, text="Enter Instagram 2FA code by command /ig_code code")
+class InstagramPost(NamedTuple):
+    caption: Optional[str]
+    media: List[Tuple[str, bool]]  # (url, is_video) in display order
 
-    @router.message(F.text.startswith("/ig_code "))
-    async def handle_message(message: types.Message):
-        if message.from_user.id == admin_id:
-            code_future.set_result(message.text.split(" ", 1)[1])
 
-    # Чекаємо на код
-    return await code_future
+def post_media(post):
+    """(url, is_video) of every media item of a post, in display order."""
+    if post.typename == "GraphSidecar":
+        return [(node.video_url if node.is_video else node.display_url, node.is_video)
+                for node in post.get_sidecar_nodes()]
+    return [(post.video_url if post.is_video else post.url, post.is_video)]
 
 
-# Асинхронна обробка авторизації Instaloader з двофакторною автентифікацією
-async def instaloader_login(L, login, password, admin_id):
-    try:
-        # Спробувати завантажити сесію
-        await asyncio.to_thread(L.load_session_from_file, login)
-        print("Login with Session")
-    except Exception as e:
-        print(e)
-        try:
-            await asyncio.to_thread(L.close)
-            await asyncio.to_thread(L.login, login, password)
-            await asyncio.to_thread(L.save_session_to_file)
-            print("Login Successful")
-        except instaloader.exceptions.TwoFactorAuthRequiredException:
-            # Отримуємо код 2FA від адміністратора
-            code = str(await wait_for_code(admin_id))
-            # Виконуємо двофакторний логін з кодом
-            await asyncio.to_thread(L.two_factor_login, code)
-            await asyncio.to_thread(L.save_session_to_file)
+async def fetch_post(media_key) -> InstagramPost:
+    """Caption and media URLs of a post. Instaloader is blocking, so it runs in a worker thread."""
+    from instaloader import Post
+
+    def resolve(loader):
+        post = Post.from_shortcode(loader.context, media_key.id)
+        return InstagramPost(post.caption, post_media(post))
+
+    async def fetch():
+        async with instagram_sessions.session() as L:
+            return await asyncio.to_thread(resolve, L)
+
+    return await metadata.get_or_fetch(media_key, fetch)
+
+
+async def download_post_media(media_key, download_dir):
+    """Fetch every item of a post (carousel) concurrently straight from the media URLs."""
+    post = await fetch_post(media_key)
+
+    items = [(url, os.path.join(download_dir, f"{idx}.{'mp4' if is_video else 'jpg'}"))
+             for idx, (url, is_video) in enumerate(post.media)]
+    await http.download_many(items)
+
+    return post, [(path, is_video) for (_, path), (_, is_video) in zip(items, post.media)]
 
 
 @router.message(F.text.regexp(r"(https?://(www\.)?instagram\.com/\S+)"))
 @router.business_message(F.text.regexp(r"(https?://(www\.)?instagram\.com/\S+)"))
-async def process_url_instagram(message: types.Message):
-    await instaloader_login(L, INST_LOGIN, INST_PASS, admin_id)
-
+async def process_url_instagram(message: types.Message, bot_url: str, profile: UserProfile):
     business_id = message.business_connection_id
 
     await send_analytics(user_id=message.from_user.id, chat_type=message.chat.type, action_name="instagram")
 
-    bot_url = f"t.me/{(await bot.get_me()).username}"
-
     url_match = re.match(r"(https?://(www\.)?instagram\.com/\S+)", message.text)
     if url_match:
         url = url_match.group(0)
@@ -76,83 +84,89 @@ async def process_url_instagram(message: types.Message):
         react = types.ReactionTypeEmoji(emoji="👨‍💻")
         await message.react([react])
 
+    media_key = resolve_media_key(url)
+
     # Get the Instagram post from URL
     try:
-        post = instaloader.Post.from_shortcode(L.context, url.split("/")[-2])
-        user_captions = await db.get_user_captions(message.from_user.id)
-        download_dir = f"{OUTPUT_DIR}.{post.shortcode}"
-
-        reels_url = "https://www.instagram.com/reel/"
+        if media_key is None:
+            raise ValueError(f"Not an Instagram post link: {url}")
 
-        post_caption = post.caption
+        user_captions = profile.captions
 
-        db_file_id = await db.get_file_id(reels_url + post.shortcode)
+        db_file_id = await db.get_file_id(media_key.url)
 
         if db_file_id:
+            # Instaloader потрібен лише для підпису
+            post_caption = None
+            if user_captions == "on":
+                post_caption = (await fetch_post(media_key)).caption
+
             if business_id is None:
                 await bot.send_chat_action(message.chat.id, "upload_video")
 
-            await message.answer_video(video=db_file_id[0][0],
+            await message.answer_video(video=db_file_id,
                                        caption=bm.captions(user_captions, post_caption, bot_url),
                                        parse_mode="HTMl")
             return
 
-        L.download_post(post, target=download_dir)
-
-        if "/reel/" in url:
+        if media_key.variant == "video":
             file_type = "video"
 
-            for root, _, files in os.walk(download_dir):
-                for file in files:
-                    if file.endswith('.mp4'):
-                        file_path = os.path.join(root, file)
-
-                        video_clip = VideoFileClip(file_path)
-                        width, height = video_clip.size
-
-                        if business_id is None:
-                            await bot.send_chat_action(message.chat.id, "upload_video")
-
-                        sent_message = await message.answer_video(video=FSInputFile(file_path),
-                                                                  caption=bm.captions(user_captions, post_caption,
-                                                                                      bot_url),
-                                                                  width=width, height=height,
-                                                                  parse_mode="HTML")
-
-                        file_id = sent_message.video.file_id
-
-                        await db.add_file(url=reels_url + post.shortcode, file_id=file_id, file_type=file_type)
-                        break
+            async def send_reel():
+                post = await fetch_post(media_key)
+                video_url = next((media_url for media_url, is_video in post.media if is_video), None)
+                if video_url is None:
+                    raise DownloadError(f"No video in Instagram post {media_key.id}")
+
+                async def reply_video(video, width, height, duration):
+                    if business_id is None:
+                        await bot.send_chat_action(message.chat.id, "upload_video")
+
+                    return await message.answer_video(video=video,
+                                                      caption=bm.captions(user_captions, post.caption, bot_url),
+                                                      width=width, height=height,
+                                                      duration=duration,
+                                                      parse_mode="HTML")
+
+                # Відео йде з CDN Instagram прямо в Telegram
+                sent_message = await stream_video(video_url, f"{media_key.id}.mp4", MAX_FILE_SIZE, reply_video)
+                return sent_message, post.caption
+
+            async def upload_reel():
+                # Акаунт Instagram береться до місця в черзі завантажень, щоб не займати його очікуванням
+                await fetch_post(media_key)
+                sent_message, post_caption = await run_download_job(message, "instagram", send_reel)
+                file_id = sent_message.video.file_id
+
+                await db.add_file(url=media_key.url, file_id=file_id, file_type=file_type)
+                return file_id, post_caption
+
+            # Одночасні запити того самого ріла чекають на перше завантаження
+            (file_id, post_caption), shared = await in_flight.do(media_key, upload_reel)
+            if shared:
+                await message.answer_video(video=file_id,
+                                           caption=bm.captions(user_captions, post_caption, bot_url),
+                                           parse_mode="HTML")
         else:
-            # Send all media if the URL is not for a reel
-            media_group = MediaGroupBuilder(caption=bm.captions(user_captions, post_caption, bot_url))
-
-            batch_size = 10
-            batch = 0
-            for root, _, files in os.walk(download_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if file.endswith(('.jpg', '.jpeg', '.png')):
-                        media_group.add_photo(media=FSInputFile(file_path), parse_mode="HTML")
-                        batch += 1
-                    elif file.endswith('.mp4'):
-                        media_group.add_video(media=FSInputFile(file_path), parse_mode="HTML")
-                        batch += 1
-
-                    if batch == batch_size:
-                        await message.answer_media_group(media=media_group.build())
-                        media_group = MediaGroupBuilder(caption=bm.captions(user_captions, post_caption, bot_url))
+            await fetch_post(media_key)
 
-            if batch > 0:
-                await message.answer_media_group(media=media_group.build())
+            async def send_post_media():
+                async with scratch.job("instagram") as download_dir:
+                    post, media_files = await download_post_media(media_key, download_dir)
+                    post_caption = post.caption
 
-        await asyncio.sleep(5)
+                    # Send all media if the URL is not for a reel
+                    batch_size = 10
+                    for start in range(0, len(media_files), batch_size):
+                        media_group = MediaGroupBuilder(caption=bm.captions(user_captions, post_caption, bot_url))
+                        for file_path, is_video in media_files[start:start + batch_size]:
+                            if is_video:
+                                media_group.add_video(media=FSInputFile(file_path), parse_mode="HTML")
+                            else:
+                                media_group.add_photo(media=FSInputFile(file_path), parse_mode="HTML")
+                        await message.answer_media_group(media=media_group.build())
 
-        # Clean up downloaded files and directory
-        for root, dirs, files in os.walk(download_dir):
-            for file in files:
-                os.remove(os.path.join(root, file))
-            os.rmdir(download_dir)
+            await run_download_job(message, "instagram", send_post_media)
 
     except Exception as e:
         print(e)
@@ -161,4 +175,4 @@ async def process_url_instagram(message: types.Message):
             await message.react([react])
         await message.reply("Something went wrong :(\nPlease try again later.")
 
-    await update_info(message)
+    await update_info(message, profile)
@@ -1,22 +1,24 @@
-import asyncio
 import datetime
+import logging
 import os
 import re
-import time
 
-import requests
 from aiogram import types, Router, F
 from aiogram.types import FSInputFile
 from aiogram.utils.media_group import MediaGroupBuilder
-from bs4 import BeautifulSoup
-from moviepy.editor import VideoFileClip, AudioFileClip
+import httpx
 
 import keyboards as kb
 import messages as bm
 from config import OUTPUT_DIR
 from handlers.user import update_info
-from helper import expand_tiktok_url
-from main import bot, db, send_analytics
+from helper import expand_tiktok_url, run_download_job, stream_video, DownloadError, FileTooLargeError
+from loader import bot, db, in_flight, media_store, metadata, scratch, send_analytics
+from services import http
+from services.audio import extract_audio
+from services.db import UserProfile
+from services.media_key import MediaKey, resolve_media_key
+from services.media_probe import get_audio_duration
 
 MAX_FILE_SIZE = 500 * 1024 * 1024
 
@@ -28,57 +30,46 @@ class DownloaderTikTok:
         self.output_dir = output_dir
         self.filename = filename
 
-    def download_video(self, video_id):
+    async def download_video(self, video_id):
         try:
             download_url = f"https://tikwm.com/video/media/play/{video_id}.mp4"
-            response = requests.get(download_url, allow_redirects=True)
-            if response.status_code == 200:
-                with open(self.filename, 'wb') as f:
-                    f.write(response.content)
-                return True
-            return False
-        except Exception as e:
-            print(f"Error: {e}")
-            return False
-
-    def download_audio(self, video_id):
-        try:
-            download_url = f"https://tikwm.com/video/music/{video_id}.mp3"
-            response = requests.get(download_url, allow_redirects=True)
-            if response.status_code == 200:
-                with open(self.filename, 'wb') as f:
-                    f.write(response.content)
-                return True
-            return False
+            await http.download(download_url, self.filename)
+            return True
         except Exception as e:
             print(f"Error: {e}")
             return False
 
-    def download_photos(self, photo_id):
+    @staticmethod
+    async def fetch_photo_links(photo_id):
+        from bs4 import BeautifulSoup
+
+        url = f"https://tikwm.com/video/{photo_id}.html"
+        response = await http.fetch(url)
+        response.raise_for_status()
+        soup = BeautifulSoup(response.content, 'html.parser')
+        photo_links = []
+        for div in soup.find_all("div", class_=["col-lg-2", "col-md-3", "col-sm-4", "col-xs-4"]):
+            a_tag = div.find("a")
+            if a_tag and 'href' in a_tag.attrs:
+                photo_links.append(a_tag['href'])
+        return photo_links
+
+    async def download_photos(self, photo_id):
         try:
-            url = f"https://tikwm.com/video/{photo_id}.html"
-            response = requests.get(url, allow_redirects=True)
-            time.sleep(1)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            photo_links = []
-            for div in soup.find_all("div", class_=["col-lg-2", "col-md-3", "col-sm-4", "col-xs-4"]):
-                a_tag = div.find("a")
-                if a_tag and 'href' in a_tag.attrs:
-                    photo_links.append(a_tag['href'])
+            photo_links = await metadata.get_or_fetch(MediaKey("tiktok", photo_id, "photo"),
+                                                      lambda: self.fetch_photo_links(photo_id))
 
             download_dir = os.path.join(self.output_dir, photo_id)
             os.makedirs(download_dir, exist_ok=True)
 
-            for idx, photo_url in enumerate(photo_links):
-                try:
-                    photo_response = requests.get(photo_url)
-                    if photo_response.status_code == 200:
-                        photo_path = os.path.join(download_dir, f"{idx}.jpg")
-                        with open(photo_path, 'wb') as f:
-                            f.write(photo_response.content)
-                except:
-                    pass
-            return True
+            # Фото, які не вдалося завантажити, пропускаємо
+            results = await http.download_many(
+                [(photo_url, os.path.join(download_dir, f"{idx}.jpg")) for idx, photo_url in enumerate(photo_links)],
+                return_exceptions=True)
+            failed = [result for result in results if isinstance(result, Exception)]
+            for error in failed:
+                logging.warning("TikTok photo of %s was not downloaded: %s", photo_id, error)
+            return len(failed) < len(results)
         except Exception as e:
             print(f"Error: {e}")
             return False
@@ -86,122 +77,136 @@ class DownloaderTikTok:
 
 @router.message(F.text.regexp(r"(https?://(www\.|vm\.|vt\.|vn\.)?tiktok\.com/\S+)"))
 @router.business_message(F.text.regexp(r"(https?://(www\.|vm\.|vt\.|vn\.)?tiktok\.com/\S+)"))
-async def process_url_tiktok(message: types.Message):
+async def process_url_tiktok(message: types.Message, bot_url: str, profile: UserProfile):
     business_id = message.business_connection_id
 
-    bot_url = f"t.me/{(await bot.get_me()).username}"
-
     url_match = re.match(r"(https?://(www\.|vm\.|vt\.|vn\.)?tiktok\.com/\S+)", message.text)
     if url_match:
         url = url_match.group(0)
     else:
         url = message.text
 
-    full_url = expand_tiktok_url(url)
+    media_key = resolve_media_key(url)
+    if media_key is None:
+        media_key = resolve_media_key(await expand_tiktok_url(url))
 
     if business_id is None:
         react = types.ReactionTypeEmoji(emoji="👨‍💻")
         await message.react([react])
 
-    if "video" in full_url:
+    if media_key is not None and media_key.variant == "video":
 
         await send_analytics(user_id=message.from_user.id, chat_type=message.chat.type, action_name="tiktok_video")
 
         file_type = "video"
         time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        video_id = full_url.split('/')[-1].split('?')[0]
+        video_id = media_key.id
         name = f"{time}_tiktok_video.mp4"
 
-        db_file_id = await db.get_file_id(full_url)
+        db_file_id = await db.get_file_id(media_key.url)
 
         if db_file_id:
             if business_id is None:
                 await bot.send_chat_action(message.chat.id, "upload_video")
 
-            await message.answer_video(video=db_file_id[0][0],
+            await message.answer_video(video=db_file_id,
                                        caption=bm.captions(None, None, bot_url),
                                        reply_markup=kb.return_audio_download_keyboard("tt",
                                                                                       video_id) if business_id is None else None,
                                        parse_mode="HTMl")
             return
 
-        video_file_path = os.path.join(OUTPUT_DIR, name)
-        downloader = DownloaderTikTok(OUTPUT_DIR, video_file_path)
-
-        if downloader.download_video(video_id):
-            video = FSInputFile(video_file_path)
-            file_size = os.path.getsize(video_file_path)
+        async def reply_video(video, width, height, duration):
+            if business_id is None:
+                await bot.send_chat_action(message.chat.id, "upload_video")
 
-            video_clip = VideoFileClip(video_file_path)
-            width, height = video_clip.size
+            return await message.reply_video(
+                video=video,
+                width=width,
+                height=height,
+                duration=duration,
+                caption=bm.captions(None, None, bot_url),
+                reply_markup=kb.return_audio_download_keyboard("tt", video_id) if business_id is None else None,
+                parse_mode="HTML"
+            )
 
-            if file_size < MAX_FILE_SIZE:
-                if business_id is None:
-                    await bot.send_chat_action(message.chat.id, "upload_video")
+        async def upload_video():
+            # Тіло відео йде з tikwm прямо в Telegram
+            video_url = f"https://tikwm.com/video/media/play/{video_id}.mp4"
 
-                sent_message = await message.reply_video(
-                    video=video,
-                    width=width,
-                    height=height,
-                    caption=bm.captions(None, None, bot_url),
-                    reply_markup=kb.return_audio_download_keyboard("tt", video_id) if business_id is None else None,
-                    parse_mode="HTML"
-                )
+            async def send_video():
+                # Копія відео лишається в сховищі для кнопки MP3
+                async with media_store.keep(media_key, name) as keep_path:
+                    return await stream_video(video_url, name, MAX_FILE_SIZE, reply_video, keep_path)
 
-                file_id = sent_message.video.file_id
+            try:
+                sent_message = await run_download_job(message, "tiktok", send_video)
+            except httpx.HTTPError as e:
+                raise DownloadError(f"TikTok video {video_id} was not downloaded") from e
 
-                await db.add_file(full_url, file_id, file_type)
+            file_id = sent_message.video.file_id
 
-            else:
-                if business_id is None:
-                    react = types.ReactionTypeEmoji(emoji="👎")
-                    await message.react([react])
-                await message.reply("The video is too large.")
+            await db.add_file(media_key.url, file_id, file_type)
+            return file_id
 
-            await asyncio.sleep(5)
-            os.remove(video_file_path)
-        else:
+        try:
+            # Одночасні запити того самого відео чекають на перше завантаження
+            file_id, shared = await in_flight.do(media_key, upload_video)
+        except FileTooLargeError:
+            if business_id is None:
+                react = types.ReactionTypeEmoji(emoji="👎")
+                await message.react([react])
+            await message.reply("The video is too large.")
+        except Exception as e:
+            print(e)
             if business_id is None:
                 react = types.ReactionTypeEmoji(emoji="👎")
                 await message.react([react])
             await message.reply("Something went wrong :(\nPlease try again later.")
+        else:
+            if shared:
+                await message.reply_video(video=file_id,
+                                          caption=bm.captions(None, None, bot_url),
+                                          reply_markup=kb.return_audio_download_keyboard("tt",
+                                                                                         video_id) if business_id is None else None,
+                                          parse_mode="HTML")
 
 
-    elif "photo" in full_url:
+    elif media_key is not None and media_key.variant == "photo":
         await send_analytics(user_id=message.from_user.id, chat_type=message.chat.type, action_name="tiktok_photos")
 
-        photo_id = full_url.split('/')[-1].split('?')[0]
-        downloader = DownloaderTikTok(OUTPUT_DIR, "")
-        download_dir = os.path.join("downloads", photo_id)
+        photo_id = media_key.id
 
-        if downloader.download_photos(photo_id):
-            all_files = []
-            for root, dirs, files in os.walk(download_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if file.endswith(('.jpg', '.jpeg', '.png')):
-                        all_files.append(file_path)
+        async def send_photos():
+            async with scratch.job("tiktok_photos") as job_dir:
+                downloader = DownloaderTikTok(job_dir, "")
+                download_dir = os.path.join(job_dir, photo_id)
 
-            all_files.sort(key=lambda x: int(os.path.basename(x).split('.')[0]))
+                if not await downloader.download_photos(photo_id):
+                    return False
 
-            if business_id is None:
-                await bot.send_chat_action(message.chat.id, "upload_photo")
+                all_files = []
+                for root, dirs, files in os.walk(download_dir):
+                    for file in files:
+                        file_path = os.path.join(root, file)
+                        if file.endswith(('.jpg', '.jpeg', '.png')):
+                            all_files.append(file_path)
+
+                all_files.sort(key=lambda x: int(os.path.basename(x).split('.')[0]))
 
-            while all_files:
-                media_group = MediaGroupBuilder(caption=bm.captions(None, None, bot_url))
-                for _ in range(min(10, len(all_files))):
-                    file_path = all_files.pop(0)
-                    media_group.add_photo(media=FSInputFile(file_path), parse_mode="HTML")
+                if business_id is None:
+                    await bot.send_chat_action(message.chat.id, "upload_photo")
 
-                await message.answer_media_group(media=media_group.build())
+                while all_files:
+                    media_group = MediaGroupBuilder(caption=bm.captions(None, None, bot_url))
+                    for _ in range(min(10, len(all_files))):
+                        file_path = all_files.pop(0)
+                        media_group.add_photo(media=FSInputFile(file_path), parse_mode="HTML")
 
-            await asyncio.sleep(5)
+                    await message.answer_media_group(media=media_group.build())
+                return True
 
-            for root, dirs, files in os.walk(download_dir):
-                for file in files:
-                    os.remove(os.path.join(root, file))
-                os.rmdir(download_dir)
-        else:
+        if not await run_download_job(message, "tiktok", send_photos):
             if business_id is None:
                 react = types.ReactionTypeEmoji(emoji="👎")
                 await message.react([react])
@@ -213,39 +218,68 @@ async def process_url_tiktok(message: types.Message):
             await message.react([react])
         await message.reply("Something went wrong :(\nPlease try again later.")
 
-    await update_info(message)
+    await update_info(message, profile)
 
 
 @router.callback_query(F.data.startswith('tt_audio_'))
-async def download_audio(call: types.CallbackQuery):
+async def download_audio(call: types.CallbackQuery, bot_url: str):
     await bot.send_chat_action(call.message.chat.id, "upload_voice")
-    bot_url = f"t.me/{(await bot.get_me()).username}"
-
     audio_id = call.data.split('_')[2]
+    media_key = MediaKey("tiktok", audio_id)
+    # Аудіо зберігається під канонічним посиланням відео
+    cache_url = media_key.url
 
-    time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    name = f"{time}_tiktok_audio.mp3"
-
-    audio_file_path = os.path.join(OUTPUT_DIR, name)
-    downloader = DownloaderTikTok(OUTPUT_DIR, audio_file_path)
-
-    if downloader.download_video(audio_id):
-        audio = AudioFileClip(audio_file_path)
-        duration = round(audio.duration)
-        file_size = os.path.getsize(audio_file_path)
-
-        if file_size > MAX_FILE_SIZE:
-            os.remove(audio_file_path)
-            await call.message.reply("The audio file is too large.")
-            os.remove(audio_file_path)
-            return
-
+    db_file_id = await db.get_file_id(cache_url, "audio")
+    if db_file_id:
         await call.answer()
-
-        await call.message.answer_audio(audio=FSInputFile(audio_file_path),
-                                        duration=duration,
-                                        caption=bm.captions(None, None, bot_url),
+        await call.message.answer_audio(audio=db_file_id, caption=bm.captions(None, None, bot_url),
                                         parse_mode="HTML")
+        return
+
+    time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"{time}_tiktok_audio.m4a"
+
+    async def cut_audio():
+        # Відео зазвичай щойно надіслане, тож аудіо вирізаємо з його локальної копії
+        video_path = media_store.get(media_key)
+        if video_path is None:
+            async with media_store.keep(media_key) as keep_path:
+                downloader = DownloaderTikTok(OUTPUT_DIR, keep_path)
+                if not await downloader.download_video(audio_id):
+                    # Недокачаний файл не має потрапити в сховище
+                    raise DownloadError(f"TikTok video {audio_id} was not downloaded")
+            video_path = media_store.get(media_key)
+            if video_path is None:
+                raise DownloadError(f"TikTok video {audio_id} is not in the media store")
+
+        async with scratch.job("tiktok_audio") as job_dir:
+            audio_file_path = os.path.join(job_dir, name)
+
+            if not await extract_audio(video_path, audio_file_path):
+                raise DownloadError(f"Audio of TikTok video {audio_id} was not extracted")
+
+            duration = get_audio_duration(audio_file_path)
+            if os.path.getsize(audio_file_path) > MAX_FILE_SIZE:
+                raise FileTooLargeError(audio_file_path)
+
+            await call.answer()
+
+            return await call.message.answer_audio(audio=FSInputFile(audio_file_path),
+                                                   duration=duration,
+                                                   caption=bm.captions(None, None, bot_url),
+                                                   parse_mode="HTML")
+
+    try:
+        sent_message = await run_download_job(call.message, "tiktok", cut_audio)
+    except FileTooLargeError:
+        await call.answer()
+        await call.message.reply("The audio file is too large.")
+        return
+    except DownloadError as e:
+        print(e)
+        await call.answer()
+        await call.message.reply("Something went wrong :(\nPlease try again later.")
+        return
 
-    await asyncio.sleep(5)
-    os.remove(audio_file_path)
+    if sent_message.audio:
+        await db.add_file(cache_url, sent_message.audio.file_id, "audio")
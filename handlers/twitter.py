@@ -1,105 +1,155 @@
-import asyncio
 import html
 import os
 import re
 from urllib.parse import urlsplit
 
-import requests
 from aiogram import types, Router, F
 from aiogram.types import FSInputFile
 from aiogram.utils.media_group import MediaGroupBuilder
 
 import messages as bm
-from config import OUTPUT_DIR
-from main import bot, db, send_analytics
+from helper import run_download_job, FileTooLargeError
+from loader import bot, db, in_flight, metadata, scratch, send_analytics, short_links
+from services import http
+from services.db import UserProfile
+from services.media_key import find_urls, is_short_link, resolve_media_key
+from services.streaming import open_media
 
 MAX_FILE_SIZE = 500 * 1024 * 1024
 
 router = Router()
 
 
-def extract_tweet_ids(text):
-    """Extract tweet IDs from message text."""
-    unshortened_links = ''
-    for link in re.findall(r't\.co\/[a-zA-Z0-9]+', text):
-        try:
-            unshortened_link = requests.get('https://' + link).url
-            unshortened_links += '\n' + unshortened_link
-        except:
-            pass
+async def extract_tweet_keys(text):
+    """Extract canonical tweet keys from message text."""
+    tweet_keys = []
+    for link in find_urls(text):
+        if is_short_link(link):
+            link = await short_links.expand(link)
+
+        media_key = resolve_media_key(link)
+        if media_key is not None and media_key.platform == "twitter":
+            tweet_keys.append(media_key)
 
-    tweet_ids = re.findall(r"(?:twitter|x)\.com/.{1,15}/(?:web|status(?:es)?)/([0-9]{1,20})", text + unshortened_links)
-    return list(dict.fromkeys(tweet_ids)) if tweet_ids else None
+    return list(dict.fromkeys(tweet_keys)) if tweet_keys else None
 
 
-def scrape_media(tweet_id):
-    r = requests.get(f'https://api.vxtwitter.com/Twitter/status/{tweet_id}')
+async def scrape_media(tweet_id):
+    r = await http.fetch(f'https://api.vxtwitter.com/Twitter/status/{tweet_id}')
     r.raise_for_status()
     try:
         return r.json()
-    except requests.exceptions.JSONDecodeError:
+    except ValueError:
         if match := re.search(r'<meta content="(.*?)" property="og:description" />', r.text):
             raise Exception(f'API returned error: {html.unescape(match.group(1))}')
         raise
 
 
-async def download_media(media_url, file_path):
-    response = requests.get(media_url, stream=True)
-    response.raise_for_status()
-    with open(file_path, 'wb') as file:
-        for chunk in response.iter_content(chunk_size=8192):
-            file.write(chunk)
+async def fetch_tweet(tweet_key):
+    return await metadata.get_or_fetch(tweet_key, lambda: scrape_media(tweet_key.id))
+
+
+async def reply_cached_video(message, tweet_key, file_id, bot_url, user_captions):
+    """Reply with a previously uploaded single-video tweet."""
+    await send_analytics(user_id=message.from_user.id, chat_type=message.chat.type, action_name="twitter")
+
+    post_caption = (await fetch_tweet(tweet_key))["text"] if user_captions == "on" else None
+
+    await message.answer_video(video=file_id, caption=bm.captions(user_captions, post_caption, bot_url))
+
+
+async def reply_single_video(message, tweet_key, media, caption):
+    """Stream a single-video tweet straight into the upload and cache its file_id."""
+    async with open_media(media['url']) as stream:
+        if stream.size is not None and stream.size >= MAX_FILE_SIZE:
+            raise FileTooLargeError(f"Video of tweet {tweet_key.id} is too large")
+
+        # vxtwitter reports the size itself, so the file never has to be spooled to disk
+        size = media.get('size') or {}
+        width, height, duration = stream.info or (size.get('width'), size.get('height'),
+                                                  round(media['duration_millis'] / 1000)
+                                                  if media.get('duration_millis') else None)
 
+        sent_message = await message.answer_video(
+            video=stream.input_file(f"{tweet_key.id}.mp4", MAX_FILE_SIZE),
+            width=width,
+            height=height,
+            duration=duration,
+            caption=caption,
+        )
 
-async def reply_media(message, tweet_id, tweet_media, bot_url, business_id):
+    file_id = sent_message.video.file_id
+    await db.add_file(tweet_key.url, file_id, "video")
+    return file_id
+
+
+async def reply_media(message, tweet_key, tweet_media, bot_url, business_id, user_captions):
     """Reply to message with supported media."""
     await send_analytics(user_id=message.from_user.id, chat_type=message.chat.type, action_name="twitter")
 
-    tweet_dir = f"{OUTPUT_DIR}/{tweet_id}"
-    post_caption = tweet_media["text"]
-    user_captions = await db.get_user_captions(message.from_user.id)
+    media_extended = tweet_media['media_extended']
+    if len(media_extended) == 1 and media_extended[0]['type'] == 'video':
+        caption = bm.captions(user_captions, tweet_media["text"], bot_url)
 
-    if not os.path.exists(tweet_dir):
-        os.makedirs(tweet_dir)
+        async def upload_video():
+            return await run_download_job(message, "twitter",
+                                          lambda: reply_single_video(message, tweet_key, media_extended[0], caption))
 
-    all_files_photo = []
-    all_files_video = []
+        try:
+            # Одночасні запити того самого твіту чекають на перше завантаження
+            file_id, shared = await in_flight.do(tweet_key, upload_video)
+            if shared:
+                await message.answer_video(video=file_id, caption=caption)
+        except FileTooLargeError:
+            if business_id is None:
+                react = types.ReactionTypeEmoji(emoji="👎")
+                await message.react([react])
+            await message.reply("The video is too large.")
+        except Exception as e:
+            print(e)
+            if business_id is None:
+                react = types.ReactionTypeEmoji(emoji="👎")
+                await message.react([react])
+            await message.reply("Something went wrong :(\nPlease try again later.")
+        return
 
-    try:
-        for media in tweet_media['media_extended']:
-            media_url = media['url']
-            media_type = media['type']
-            file_name = os.path.join(tweet_dir, os.path.basename(urlsplit(media_url).path))
-
-            await download_media(media_url, file_name)
-
-            if media_type == 'image':
-                all_files_photo.append(file_name)
-            elif media_type == 'video' or media_type == 'gif':
-                all_files_video.append(file_name)
-
-        while all_files_photo:
-            media_group = MediaGroupBuilder(caption=bm.captions(user_captions, post_caption, bot_url))
-            for _ in range(min(10, len(all_files_photo))):
-                file_path = all_files_photo.pop(0)
-                media_group.add_photo(media=FSInputFile(file_path))
-            await message.answer_media_group(media_group.build())
-
-        while all_files_video:
-            media_group = MediaGroupBuilder(caption=bm.captions(user_captions, post_caption, bot_url))
-            for _ in range(min(10, len(all_files_video))):
-                file_path = all_files_video.pop(0)
-                media_group.add_video(media=FSInputFile(file_path))
-            await message.answer_media_group(media_group.build())
-
-        await asyncio.sleep(5)
-
-        # Видалення папки після завантаження
-        for root, dirs, files in os.walk(tweet_dir):
-            for file in files:
-                os.remove(os.path.join(root, file))
-        os.rmdir(tweet_dir)
+    post_caption = tweet_media["text"]
+
+    async def send_media_group():
+        all_files_photo = []
+        all_files_video = []
+
+        # Каталог задачі видаляється разом із файлами, навіть якщо надсилання впало
+        async with scratch.job("twitter") as tweet_dir:
+            items = [(media['url'], os.path.join(tweet_dir, os.path.basename(urlsplit(media['url']).path)))
+                     for media in tweet_media['media_extended']]
+
+            # Усі медіа твіту завантажуються паралельно, порядок зберігається
+            await http.download_many(items)
+
+            for media, (_, file_name) in zip(tweet_media['media_extended'], items):
+                media_type = media['type']
+                if media_type == 'image':
+                    all_files_photo.append(file_name)
+                elif media_type == 'video' or media_type == 'gif':
+                    all_files_video.append(file_name)
+
+            while all_files_photo:
+                media_group = MediaGroupBuilder(caption=bm.captions(user_captions, post_caption, bot_url))
+                for _ in range(min(10, len(all_files_photo))):
+                    file_path = all_files_photo.pop(0)
+                    media_group.add_photo(media=FSInputFile(file_path))
+                await message.answer_media_group(media_group.build())
+
+            while all_files_video:
+                media_group = MediaGroupBuilder(caption=bm.captions(user_captions, post_caption, bot_url))
+                for _ in range(min(10, len(all_files_video))):
+                    file_path = all_files_video.pop(0)
+                    media_group.add_video(media=FSInputFile(file_path))
+                await message.answer_media_group(media_group.build())
 
+    try:
+        await run_download_job(message, "twitter", send_media_group)
     except Exception as e:
         print(e)
         if business_id is None:
@@ -110,23 +160,26 @@ async def reply_media(message, tweet_id, tweet_media, bot_url, business_id):
 
 @router.message(F.text.regexp(r"(https?://(www\.)?(twitter|x)\.com/\S+|https?://t\.co/\S+)"))
 @router.business_message(F.text.regexp(r"(https?://(www\.)?(twitter|x)\.com/\S+|https?://t\.co/\S+)"))
-async def handle_tweet_links(message):
+async def handle_tweet_links(message, bot_url: str, profile: UserProfile):
     business_id = message.business_connection_id
 
     if business_id is None:
         react = types.ReactionTypeEmoji(emoji="👨‍💻")
         await message.react([react])
 
-    bot_url = f"t.me/{(await bot.get_me()).username}"
-
-    tweet_ids = extract_tweet_ids(message.text)
-    if tweet_ids:
+    tweet_keys = await extract_tweet_keys(message.text)
+    if tweet_keys:
         if business_id is None:
             await bot.send_chat_action(message.chat.id, "typing")
 
-        for tweet_id in tweet_ids:
-            media = scrape_media(tweet_id)
-            await reply_media(message, tweet_id, media, bot_url, business_id)
+        for tweet_key in tweet_keys:
+            db_file_id = await db.get_file_id(tweet_key.url)
+            if db_file_id:
+                await reply_cached_video(message, tweet_key, db_file_id, bot_url, profile.captions)
+                continue
+
+            media = await fetch_tweet(tweet_key)
+            await reply_media(message, tweet_key, media, bot_url, business_id, profile.captions)
     else:
         if business_id is None:
             react = types.ReactionTypeEmoji(emoji="👎")
@@ -1,31 +1,18 @@
-import datetime
-from collections import defaultdict
-
 from aiogram import types, Router, F
 from aiogram.filters import Command
-
-import os
-import matplotlib.pyplot as plt
-from aiogram.types import FSInputFile
-from matplotlib.ticker import MaxNLocator
+from aiogram.types import BufferedInputFile
 
 import keyboards as kb
 import messages as bm
-from main import db, send_analytics, bot
+from loader import chart_cache, db, send_analytics, bot, user_updates
+from services.db import UserProfile
 
 router = Router()
 
 
-async def update_info(message: types.Message):
-    user_id = message.from_user.id
-    user_name = message.from_user.full_name
-    user_username = message.from_user.username
-    result = await db.user_exist(user_id)
-    if result:
-        await db.user_update_name(user_id, user_name, user_username)
-    else:
-        await db.add_users(user_id, user_name, user_username, "private", "uk", 'active')
-    await db.set_active(user_id)
+async def update_info(message: types.Message, profile: UserProfile):
+    # Запис відкладений: зміни збираються в буфер і пишуться однією пачкою у фоні
+    user_updates.record(message.from_user.id, message.from_user.full_name, message.from_user.username, profile)
 
 
 @router.message(F.new_chat_member)
@@ -50,11 +37,11 @@ async def send_welcome(message: types.Message):
 
 
 @router.message(Command("start"))
-async def send_welcome(message: types.Message):
+async def send_welcome(message: types.Message, profile: UserProfile):
     await send_analytics(user_id=message.from_user.id, chat_type=message.chat.type, action_name='start')
 
     await message.reply(bm.welcome_message())
-    await update_info(message)
+    await update_info(message, profile)
 
 
 @router.message(Command("settings"))
@@ -76,11 +63,10 @@ async def back_to_settings(call: types.CallbackQuery):
 
 
 @router.callback_query(F.data == "settings_caption")
-async def captions_setting(call: types.CallbackQuery):
-    user_captions = await db.get_user_captions(call.from_user.id)
+async def captions_setting(call: types.CallbackQuery, profile: UserProfile):
     await call.message.edit_text(
         text=bm.captions_settings(),
-        reply_markup=kb.return_captions_keyboard(captions=user_captions), parse_mode='HTML')
+        reply_markup=kb.return_captions_keyboard(captions=profile.captions), parse_mode='HTML')
     await call.answer()
 
 
@@ -92,72 +78,20 @@ async def change_captions(call: types.CallbackQuery):
     await call.answer()
 
 
-def create_and_save_chart(data, period):
-    # Генеруємо унікальну назву файлу
-    filename = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + "_chart.png"
-
-    dates = list(data.keys())
-    counts = list(data.values())
-
-    # Обробка даних залежно від періоду
-    if period == 'Month':
-        # Вибір кожного 3-го дня для місячних даних
-        dates = dates[::3]
-        counts = counts[::3]
-    elif period == 'Year':
-        # Агрегація по місяцях для річних даних
-        monthly_data = defaultdict(int)
-        for date_str, count in data.items():
-            date = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-            month_key = date.strftime("%Y-%m")
-            monthly_data[month_key] += count
-        dates = list(monthly_data.keys())
-        counts = list(monthly_data.values())
-
-    # Використання темної теми
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 5), facecolor='#2E2E2E')
-
-    # Побудова графіку з лінією, точками та прозорою заливкою
-    ax.plot(dates, counts, marker='o', color='#4CAF50', markersize=8, linewidth=2, label='Downloads')
-    ax.fill_between(dates, counts, color='#4CAF50', alpha=0.3)
-
-    # Заголовок і підписи осей
-    ax.set_title('Statistics of Downloaded Videos', fontsize=16, color='#FFFFFF')
-    ax.set_xlabel('Date', fontsize=12, color='#B0B0B0')
-    ax.set_ylabel('Number of Downloads', fontsize=12, color='#B0B0B0')
+async def answer_chart(message: types.Message, period: str):
+    chart = await chart_cache.get(period)
 
-    # Обмеження кількості міток на осі X
-    ax.xaxis.set_major_locator(MaxNLocator(8))
-
-    # Налаштування кольорів сітки, осей та тексту
-    ax.grid(True, color='#444444', linestyle='--', linewidth=0.5)
-    ax.spines['bottom'].set_color('#FFFFFF')
-    ax.spines['left'].set_color('#FFFFFF')
-    ax.tick_params(axis='x', colors='#B0B0B0')
-    ax.tick_params(axis='y', colors='#B0B0B0')
-
-    # Збереження зображення з темним фоном
-    fig.savefig(filename, bbox_inches='tight', facecolor=fig.get_facecolor())
-    plt.close(fig)
-
-    return filename
+    # Після першого відправлення графік повторно надсилається за file_id
+    photo = chart.file_id or BufferedInputFile(chart.png, filename=f"{period.lower()}_chart.png")
+    sent_message = await message.answer_photo(photo, caption=f'Statistics for {period}',
+                                              reply_markup=kb.stats_keyboard())
+    if chart.file_id is None:
+        chart.file_id = sent_message.photo[-1].file_id
 
 
 @router.message(Command("stats"))
 async def stats_command(message: types.Message):
-    data_today = await db.get_downloaded_files_count('Week')
-    period = "Week"
-    filename = create_and_save_chart(data_today, period)
-
-    # Відправляємо зображення
-    chart_input_file = FSInputFile(filename)
-    await message.answer_photo(chart_input_file, caption='Statistics for Week',
-                               reply_markup=kb.stats_keyboard())
-
-    # Видаляємо файл після відправлення
-    if os.path.exists(filename):
-        os.remove(filename)
+    await answer_chart(message, "Week")
 
 
 @router.callback_query(F.data.startswith('date_'))
@@ -167,14 +101,4 @@ async def switch_period(call: types.CallbackQuery):
 
     # Отримуємо новий період
     period = call.data.split("_")[1]
-    data = await db.get_downloaded_files_count(period)
-    filename = create_and_save_chart(data, period)
-
-    # Відправляємо нове зображення
-    chart_input_file = FSInputFile(filename)
-    await call.message.answer_photo(chart_input_file, caption=f'Statistics for {period}',
-                                    reply_markup=kb.stats_keyboard())
-
-    # Видаляємо файл після відправлення
-    if os.path.exists(filename):
-        os.remove(filename)
+    await answer_chart(call.message, period)
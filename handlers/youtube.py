@@ -1,27 +1,33 @@
 import asyncio
 import datetime
 import os
+import re
 import time
 
-import requests
 from aiogram import types, Router, F
 from aiogram.types import FSInputFile
-from moviepy.editor import VideoFileClip, AudioFileClip
-from pytubefix import YouTube
-from pytubefix.cli import on_progress
 
 import keyboards as kb
 import messages as bm
-from config import OUTPUT_DIR, BOT_TOKEN, admin_id
+from config import BOT_TOKEN, admin_id
 from handlers.user import update_info
-from main import bot, db, send_analytics
+from helper import FileTooLargeError, run_download_job
+from loader import bot, db, in_flight, media_store, metadata, scratch, send_analytics
+from services.audio import extract_audio
+from services.db import UserProfile
+from services.media_key import resolve_media_key
+from services.media_probe import get_audio_duration, get_video_info
 
 MAX_FILE_SIZE = 1 * 1024 * 1024
 
+YOUTUBE_URL_REGEX = r"(https?://(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/\S+)"
+
 router = Router()
 
 
 def custom_oauth_verifier(verification_url, user_code):
+    import requests
+
     send_message_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
 
     params = {
@@ -43,22 +49,56 @@ def custom_oauth_verifier(verification_url, user_code):
         time.sleep(5)
 
 
-def download_youtube_video(video, name):
-    video.download(output_path=OUTPUT_DIR, filename=name)
+def youtube_client(url):
+    # pytubefix імпортується лише при першому посиланні на YouTube
+    from pytubefix import YouTube
+    from pytubefix.cli import on_progress
+
+    return YouTube(url, use_oauth=True, allow_oauth_cache=True, on_progress_callback=on_progress,
+                   oauth_verifier=custom_oauth_verifier)
+
+
+def load_youtube(url):
+    """Client with the stream list and video details already fetched."""
+    yt = youtube_client(url)
+    yt.streams
+    yt.title
+    return yt
+
+
+async def get_youtube(url):
+    # Метадані ролика спільні для відео, аудіо та кнопки MP3 після відео
+    media_key = resolve_media_key(url)
+    if media_key is None:
+        return await asyncio.to_thread(load_youtube, url)
+    return await metadata.get_or_fetch(media_key, lambda: asyncio.to_thread(load_youtube, media_key.url))
+
+
+def download_youtube_video(video, path):
+    video.download(output_path=os.path.dirname(path), filename=os.path.basename(path))
+
+
+async def fetch_audio(media_key, audio, path):
+    """Cut the audio out of the stored video if it was sent recently, otherwise download the audio stream."""
+    video_path = media_store.get(media_key) if media_key is not None else None
+    if video_path is not None and await extract_audio(video_path, path):
+        return
+    await asyncio.to_thread(download_youtube_video, audio, path)
 
 
 # Download video
-@router.message(F.text.regexp(r"(https?://(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/\S+)"))
-@router.business_message(F.text.regexp(r"(https?://(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/\S+)"))
-async def download_video(message: types.Message):
+@router.message(F.text.regexp(YOUTUBE_URL_REGEX))
+@router.business_message(F.text.regexp(YOUTUBE_URL_REGEX))
+async def download_video(message: types.Message, bot_url: str, profile: UserProfile):
     business_id = message.business_connection_id
 
     await send_analytics(user_id=message.from_user.id, chat_type=message.chat.type, action_name="youtube_video")
 
-    bot_url = f"t.me/{(await bot.get_me()).username}"
     file_type = "video"
 
-    url = message.text
+    url_match = re.match(YOUTUBE_URL_REGEX, message.text)
+    url = url_match.group(0) if url_match else message.text
+    media_key = resolve_media_key(url)
     try:
         if business_id is None:
             react = types.ReactionTypeEmoji(emoji="👨‍💻")
@@ -67,66 +107,86 @@ async def download_video(message: types.Message):
         time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         name = f"{time}_youtube_video.mp4"
 
-        yt = YouTube(url, use_oauth=True, allow_oauth_cache=True, on_progress_callback=on_progress,
-                     oauth_verifier=custom_oauth_verifier)
-        video = yt.streams.filter(res="1080p", file_extension='mp4', progressive=True).first()
-
-        if not video:
-            video = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
-            if not video:
-                await message.reply("The URL does not seem to be a valid YouTube video link.")
-                return
+        user_captions = profile.captions
 
-        post_caption = yt.title
+        if media_key is not None:
+            db_file_id = await db.get_file_id(media_key.url)
 
-        user_captions = await db.get_user_captions(message.from_user.id)
+            if db_file_id:
+                # Метадані потрібні лише для підпису
+                post_caption = None
+                if user_captions == "on":
+                    post_caption = (await get_youtube(media_key.url)).title
 
-        db_file_id = await db.get_file_id(yt.watch_url)
+                if business_id is None:
+                    await bot.send_chat_action(message.chat.id, "upload_video")
 
-        if db_file_id:
-            if business_id is None:
-                await bot.send_chat_action(message.chat.id, "upload_video")
+                await message.answer_video(video=db_file_id,
+                                           caption=bm.captions(user_captions, post_caption, bot_url),
+                                           reply_markup=kb.return_audio_download_keyboard("yt",
+                                                                                          media_key.url) if business_id is None else None,
+                                           parse_mode="HTMl")
+                return
 
-            await message.answer_video(video=db_file_id[0][0],
-                                       caption=bm.captions(user_captions, post_caption, bot_url),
-                                       reply_markup=kb.return_audio_download_keyboard("yt",
-                                                                                      yt.watch_url) if business_id is None else None,
-                                       parse_mode="HTMl")
-            return
+        async def upload_video():
+            yt = await get_youtube(url)
+            video = yt.streams.filter(res="1080p", file_extension='mp4', progressive=True).first()
 
-        size = video.filesize_kb
+            if not video:
+                video = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
+                if not video:
+                    return None
 
-        if size < MAX_FILE_SIZE:
+            post_caption = yt.title
+            cache_url = media_key.url if media_key is not None else yt.watch_url
 
-            video_file_path = os.path.join(OUTPUT_DIR, name)
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, download_youtube_video, video, name)
+            if video.filesize_kb >= MAX_FILE_SIZE:
+                raise FileTooLargeError(cache_url)
 
-            video_clip = VideoFileClip(video_file_path)
+            async def send_video():
+                # Відео лишається в сховищі на випадок натискання кнопки MP3
+                async with media_store.keep(media_key, name, video.filesize) as video_file_path:
+                    await asyncio.to_thread(download_youtube_video, video, video_file_path)
 
-            width, height = video_clip.size
+                    width, height, duration = get_video_info(video_file_path)
 
-            if business_id is None:
-                await bot.send_chat_action(message.chat.id, "upload_video")
+                    if business_id is None:
+                        await bot.send_chat_action(message.chat.id, "upload_video")
 
-            sent_message = await message.answer_video(video=FSInputFile(video_file_path),
+                    return await message.answer_video(video=FSInputFile(video_file_path, filename=name),
                                                       width=width,
                                                       height=height,
+                                                      duration=duration,
                                                       caption=bm.captions(user_captions, post_caption, bot_url),
                                                       reply_markup=kb.return_audio_download_keyboard("yt",
-                                                                                                     yt.watch_url) if business_id is None else None)
-            file_id = sent_message.video.file_id
+                                                                                                     cache_url) if business_id is None else None)
 
-            await db.add_file(yt.watch_url, file_id, file_type)
+            sent_message = await run_download_job(message, "youtube", send_video, size=video.filesize)
+            file_id = sent_message.video.file_id
 
-            await asyncio.sleep(5)
+            await db.add_file(cache_url, file_id, file_type)
+            return file_id, post_caption, cache_url
 
-        else:
+        try:
+            # Одночасні запити того самого відео чекають на перше завантаження
+            result, shared = await in_flight.do(media_key or url, upload_video)
+        except FileTooLargeError:
             if business_id is None:
                 react = types.ReactionTypeEmoji(emoji="👎")
                 await message.react([react])
 
             await message.reply("The video is too large.")
+        else:
+            if result is None:
+                await message.reply("The URL does not seem to be a valid YouTube video link.")
+                return
+
+            if shared:
+                file_id, post_caption, cache_url = result
+                await message.answer_video(video=file_id,
+                                           caption=bm.captions(user_captions, post_caption, bot_url),
+                                           reply_markup=kb.return_audio_download_keyboard("yt",
+                                                                                          cache_url) if business_id is None else None)
 
     except Exception as e:
         print(e)
@@ -136,110 +196,121 @@ async def download_video(message: types.Message):
 
         await message.reply("Something went wrong :(\nPlease try again later.")
 
-    await update_info(message)
+    await update_info(message, profile)
 
 
 @router.callback_query(F.data.startswith('yt_audio_'))
-async def download_audio(call: types.CallbackQuery):
-    bot_url = f"t.me/{(await bot.get_me()).username}"
-
-    url = call.data.split('_')[2]
+async def download_audio(call: types.CallbackQuery, bot_url: str):
+    url = call.data.split('_', 2)[2]
+    media_key = resolve_media_key(url)
+    cache_url = media_key.url if media_key is not None else url
+
+    db_file_id = await db.get_file_id(cache_url, "audio")
+    if db_file_id:
+        await call.answer()
+        await call.message.answer_audio(audio=db_file_id, caption=bm.captions(None, None, bot_url),
+                                        parse_mode="HTML")
+        return
 
     time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    name = f"{time}_youtube_audio.mp3"
+    name = f"{time}_youtube_audio.m4a"
 
-    yt = YouTube(url, use_oauth=True, allow_oauth_cache=True, on_progress_callback=on_progress,
-                 oauth_verifier=custom_oauth_verifier)
+    yt = await get_youtube(url)
     audio = yt.streams.filter(only_audio=True, file_extension='mp4').first()
 
     if not audio:
         await call.message.reply("The URL does not seem to be a valid YouTube music link.")
         return
 
-    file_size = audio.filesize_kb
-
-    audio_file_path = os.path.join(OUTPUT_DIR, name)
-
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, download_youtube_video, audio, name)
-
     # Check file size
-    if file_size > MAX_FILE_SIZE:
-        os.remove(audio_file_path)
+    if audio.filesize_kb > MAX_FILE_SIZE:
         await call.message.reply("The audio file is too large.")
         return
 
-    audio_duration = AudioFileClip(audio_file_path)
-    duration = round(audio_duration.duration)
+    async def send_audio():
+        async with scratch.job("youtube_audio", audio.filesize) as job_dir:
+            audio_file_path = os.path.join(job_dir, name)
 
-    await call.answer()
+            await fetch_audio(media_key, audio, audio_file_path)
 
-    await bot.send_chat_action(call.message.chat.id, "upload_voice")
+            # Тривалість з метаданих YouTube, файл читаємо лише якщо її немає
+            duration = yt.length or get_audio_duration(audio_file_path)
 
-    # Send audio file
-    await call.message.answer_audio(audio=FSInputFile(audio_file_path), title=yt.title,
-                                    performer=yt.author, duration=duration,
-                                    caption=bm.captions(None, None, bot_url),
-                                    parse_mode="HTML")
+            await call.answer()
 
-    await asyncio.sleep(5)
-    os.remove(audio_file_path)
+            await bot.send_chat_action(call.message.chat.id, "upload_voice")
 
+            # Send audio file
+            return await call.message.answer_audio(audio=FSInputFile(audio_file_path), title=yt.title,
+                                                   performer=yt.author, duration=duration,
+                                                   caption=bm.captions(None, None, bot_url),
+                                                   parse_mode="HTML")
 
-def download_youtube_audio(audio, name):
-    audio.download(output_path=OUTPUT_DIR, filename=name)
+    sent_message = await run_download_job(call.message, "youtube", send_audio, size=audio.filesize)
+    if sent_message.audio:
+        await db.add_file(cache_url, sent_message.audio.file_id, "audio")
 
 
 @router.message(F.text.regexp(r'(https?://)?(music\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/.+'))
 @router.business_message(F.text.regexp(r'(https?://)?(music\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/.+'))
-async def download_music(message: types.Message):
+async def download_music(message: types.Message, bot_url: str, profile: UserProfile):
     business_id = message.business_connection_id
 
     await send_analytics(user_id=message.from_user.id, chat_type=message.chat.type, action_name="youtube_audio")
 
-    bot_url = f"t.me/{(await bot.get_me()).username}"
     url = message.text
+    media_key = resolve_media_key(url)
 
     if business_id is None:
         react = types.ReactionTypeEmoji(emoji="👨‍💻")
         await message.react([react])
     try:
+        if media_key is not None:
+            db_file_id = await db.get_file_id(media_key.url, "audio")
+
+            if db_file_id:
+                if business_id is None:
+                    await bot.send_chat_action(message.chat.id, "upload_voice")
+
+                await message.answer_audio(audio=db_file_id, caption=bm.captions(None, None, bot_url),
+                                           parse_mode="HTML")
+                await update_info(message, profile)
+                return
+
         time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        name = f"{time}_youtube_audio.mp3"
+        name = f"{time}_youtube_audio.m4a"
 
-        yt = YouTube(url, use_oauth=True, allow_oauth_cache=True, on_progress_callback=on_progress,
-                     oauth_verifier=custom_oauth_verifier)
+        yt = await get_youtube(url)
         audio = yt.streams.filter(only_audio=True, file_extension='mp4').first()
 
         if not audio:
             await message.reply("The URL does not seem to be a valid YouTube music link.")
             return
 
-        file_size = audio.filesize_kb
-
-        audio_file_path = os.path.join(OUTPUT_DIR, name)
-
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, download_youtube_video, audio, name)
-
-        if file_size > MAX_FILE_SIZE:
-            os.remove(audio_file_path)
+        if audio.filesize_kb > MAX_FILE_SIZE:
             await message.reply("The audio file is too large.")
             return
 
-        audio_duration = AudioFileClip(audio_file_path)
-        duration = round(audio_duration.duration)
+        async def send_audio():
+            async with scratch.job("youtube_audio", audio.filesize) as job_dir:
+                audio_file_path = os.path.join(job_dir, name)
 
-        if business_id is None:
-            await bot.send_chat_action(message.chat.id, "upload_voice")
+                await fetch_audio(media_key, audio, audio_file_path)
+
+                duration = yt.length or get_audio_duration(audio_file_path)
+
+                if business_id is None:
+                    await bot.send_chat_action(message.chat.id, "upload_voice")
 
-        await message.answer_audio(audio=FSInputFile(audio_file_path), title=yt.title,
-                                   performer=yt.author, duration=duration,
-                                   caption=bm.captions(None, None, bot_url),
-                                   parse_mode="HTML")
+                return await message.answer_audio(audio=FSInputFile(audio_file_path), title=yt.title,
+                                                  performer=yt.author, duration=duration,
+                                                  caption=bm.captions(None, None, bot_url),
+                                                  parse_mode="HTML")
 
-        await asyncio.sleep(5)
-        os.remove(audio_file_path)
+        sent_message = await run_download_job(message, "youtube", send_audio, size=audio.filesize)
+        if sent_message.audio:
+            await db.add_file(media_key.url if media_key is not None else yt.watch_url,
+                              sent_message.audio.file_id, "audio")
     except Exception as e:
         print(e)
         if business_id is None:
@@ -247,5 +318,5 @@ async def download_music(message: types.Message):
             await message.react([react])
         await message.reply("Something went wrong :(\nPlease try again later.")
 
-    await update_info(message)
+    await update_info(message, profile)
     
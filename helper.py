@@ -1,8 +1,14 @@
+import logging
 import os
 import random
 
-import requests
-from moviepy.editor import VideoFileClip
+from aiogram.types import FSInputFile
+
+import messages as bm
+from loader import scheduler, scratch, short_links
+from services import http
+from services.media_probe import get_video_info
+from services.streaming import open_media
 
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36',
@@ -29,21 +35,81 @@ USER_AGENTS = [
 ]
 
 
+class DownloadError(Exception):
+    """Media could not be fetched from the source."""
+
+
+class FileTooLargeError(Exception):
+    """Media exceeds the upload size limit."""
+
+
+async def run_download_job(message, platform, func, size=None):
+    """Run ``func`` through the download scheduler, showing the queue position while it waits.
+
+    Business chats get no queue notice: the bot writes there on behalf of the account owner.
+    """
+    notice = None
+
+    async def show_position(position):
+        nonlocal notice
+        notice = await message.reply(bm.download_queued(position), parse_mode="HTML")
+
+    # У бізнес-чатах бот пише від імені власника, тож службове повідомлення там зайве
+    on_wait = show_position if message.business_connection_id is None else None
+    try:
+        return await scheduler.submit(platform, func, size=size, on_wait=on_wait)
+    finally:
+        if notice is not None:
+            try:
+                await notice.delete()
+            except Exception as e:
+                logging.warning("Could not delete queue notice: %s", e)
+
+
+async def stream_video(url, name, max_size, reply, keep_path=None):
+    """Send the video at ``url`` with ``reply(video, width, height, duration)`` while it downloads.
+
+    The body goes straight into the upload; it is spooled to disk only if the MP4 header
+    is at the end of the file, because the dimensions then need a seekable file. With
+    ``keep_path`` set, a copy of the video is left there (see ``MediaStore.keep``).
+    """
+    async with open_media(url) as media:
+        if media.size is not None and media.size >= max_size:
+            raise FileTooLargeError(name)
+
+        if media.info is not None:
+            if keep_path is None:
+                return await reply(media.input_file(name, max_size), *media.info)
+            with open(keep_path, "wb") as sink:
+                return await reply(media.input_file(name, max_size, sink), *media.info)
+
+        async def spool_and_reply(file_path):
+            await media.spool(file_path)
+            if os.path.getsize(file_path) >= max_size:
+                raise FileTooLargeError(file_path)
+            return await reply(FSInputFile(file_path, filename=name), *get_video_info(file_path))
+
+        if keep_path is not None:
+            return await spool_and_reply(keep_path)
+        async with scratch.job("video", media.size) as job_dir:
+            return await spool_and_reply(os.path.join(job_dir, name))
+
+
 def random_ua():
     return random.choice(USER_AGENTS)
 
 
-def get_content(url: str, output_dir: str, output_name: str):
+async def get_content(url: str, output_dir: str, output_name: str):
     try:
-        res = requests.get(url, stream=True, timeout=1000)
-        if res.headers.get('Content-Type', '').find('audio/mpeg') >= 0:
-            return False
+        async with http.stream(url, timeout=1000) as res:
+            if res.headers.get('Content-Type', '').find('audio/mpeg') >= 0:
+                return False
 
-        output_path = os.path.join(output_dir, output_name)
+            output_path = os.path.join(output_dir, output_name)
 
-        with open(output_path, "wb") as w:
-            for data in res.iter_content(chunk_size=2048):
-                w.write(data)
+            with open(output_path, "wb") as w:
+                async for data in res.aiter_bytes(2048):
+                    w.write(data)
         return True
 
     except Exception as e:
@@ -51,10 +117,6 @@ def get_content(url: str, output_dir: str, output_name: str):
         return False
 
 
-def expand_tiktok_url(short_url: str) -> str:
-    try:
-        response = requests.head(short_url, allow_redirects=True, headers={'User-Agent': random_ua()})
-        return response.url
-    except requests.RequestException as e:
-        print(f"Error expanding URL: {e}")
-        return short_url
+async def expand_tiktok_url(short_url: str) -> str:
+    # Ціль кешується, тож повторні поширення того самого посилання не йдуть у мережу
+    return await short_links.expand(short_url, headers={'User-Agent': random_ua()})
@@ -0,0 +1,121 @@
+"""Objects shared by the entry point, handlers and middlewares.
+
+They live here rather than in main.py: ``python main.py`` runs that file as ``__main__``,
+so ``from main import ...`` would load a second copy with its own, never started objects.
+"""
+import os
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums.parse_mode import ParseMode
+
+import config
+from config import BOT_TOKEN, OUTPUT_DIR, custom_api_url, MEASUREMENT_ID, API_SECRET
+from services.analytics import AnalyticsBuffer
+from services.broadcast import Broadcaster
+from services.charts import ChartCache
+from services.db import DataBase
+from services.instagram_sessions import InstagramSessionManager
+from services.media_store import MediaStore
+from services.metadata import MetadataCache
+from services.scheduler import DownloadScheduler
+from services.scratch import ScratchSpace
+from services.short_links import ShortLinkResolver
+from services.singleflight import SingleFlight
+from services.user_updates import UserUpdateBuffer
+
+custom_timeout = 600  # 10 minutes
+
+session = AiohttpSession(
+    api=TelegramAPIServer.from_base(custom_api_url),
+    timeout=custom_timeout
+)
+
+default = DefaultBotProperties(parse_mode=ParseMode.HTML)
+bot = Bot(token=BOT_TOKEN, default=default, session=session)
+
+dp = Dispatcher()
+
+db = DataBase()
+
+user_updates = UserUpdateBuffer(
+    db,
+    flush_interval=config.USER_UPDATE_FLUSH_INTERVAL,
+    batch_size=config.USER_UPDATE_BATCH_SIZE,
+)
+
+broadcaster = Broadcaster(
+    bot,
+    db,
+    rate=config.BROADCAST_RATE,
+    concurrency=config.BROADCAST_CONCURRENCY,
+    batch_size=config.BROADCAST_BATCH_SIZE,
+    progress_interval=config.BROADCAST_PROGRESS_INTERVAL,
+)
+
+chart_cache = ChartCache(db)
+
+metadata = MetadataCache(
+    maxsize=config.METADATA_CACHE_SIZE,
+    ttls=config.METADATA_CACHE_TTL,
+    default_ttl=config.METADATA_CACHE_DEFAULT_TTL,
+    path=config.METADATA_CACHE_PATH,
+)
+
+short_links = ShortLinkResolver(
+    db,
+    maxsize=config.SHORT_LINK_CACHE_SIZE,
+    ttl=config.SHORT_LINK_TTL,
+    max_redirects=config.SHORT_LINK_MAX_REDIRECTS,
+)
+
+scratch = ScratchSpace(
+    root=OUTPUT_DIR,
+    budget=config.SCRATCH_BUDGET,
+    default_size=config.SCRATCH_DEFAULT_SIZE,
+    orphan_age=config.SCRATCH_ORPHAN_AGE,
+    sweep_interval=config.SCRATCH_SWEEP_INTERVAL,
+    keep=[os.path.basename(config.MEDIA_STORE_DIR)],
+)
+
+media_store = MediaStore(
+    directory=config.MEDIA_STORE_DIR,
+    ttl=config.MEDIA_STORE_TTL,
+    max_bytes=config.MEDIA_STORE_MAX_BYTES,
+    sweep_interval=config.MEDIA_STORE_SWEEP_INTERVAL,
+    scratch=scratch,
+)
+
+instagram_sessions = InstagramSessionManager(
+    accounts=config.INST_ACCOUNTS,
+    budget=config.INST_REQUEST_BUDGET,
+    window=config.INST_BUDGET_WINDOW,
+    health_interval=config.INST_HEALTH_CHECK_INTERVAL,
+    cooldown=config.INST_THROTTLE_COOLDOWN,
+    acquire_timeout=config.INST_ACQUIRE_TIMEOUT,
+    notify=lambda text: bot.send_message(chat_id=config.admin_id, text=text),
+)
+
+in_flight = SingleFlight()
+
+scheduler = DownloadScheduler(
+    global_limit=config.DOWNLOAD_CONCURRENCY,
+    platform_limits=config.PLATFORM_CONCURRENCY,
+    bytes_per_second=config.SCHEDULER_BYTES_PER_SECOND,
+    default_size=config.SCHEDULER_DEFAULT_SIZE,
+)
+
+analytics = AnalyticsBuffer(
+    measurement_id=MEASUREMENT_ID,
+    api_secret=API_SECRET,
+    max_queue=config.ANALYTICS_MAX_QUEUE,
+    batch_size=config.ANALYTICS_BATCH_SIZE,
+    flush_interval=config.ANALYTICS_FLUSH_INTERVAL,
+)
+
+
+async def send_analytics(user_id, chat_type, action_name):
+    # Лише додає подію в буфер, відправка відбувається у фоні
+    analytics.enqueue(user_id, chat_type, action_name)
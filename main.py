@@ -1,52 +1,32 @@
+import asyncio
 import logging
 import os
 
-import httpx
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.client.session.aiohttp import AiohttpSession
-from aiogram.client.telegram import TelegramAPIServer
-from aiogram.enums.parse_mode import ParseMode
-
-from config import BOT_TOKEN, BOT_COMMANDS, OUTPUT_DIR, custom_api_url, MEASUREMENT_ID, API_SECRET
-from services.db import DataBase
+import config
+from config import BOT_COMMANDS, OUTPUT_DIR
+from loader import (analytics, bot, broadcaster, db, dp, instagram_sessions, media_store, metadata, scratch,
+                    user_updates)
+from services import charts, http
 
 logging.basicConfig(level=logging.INFO)
 
-custom_timeout = 600  # 10 minutes
-
-session = AiohttpSession(
-    api=TelegramAPIServer.from_base(custom_api_url),
-    timeout=custom_timeout
-)
-
-default = DefaultBotProperties(parse_mode=ParseMode.HTML)
-bot = Bot(token=BOT_TOKEN, default=default, session=session)
-
-dp = Dispatcher()
 
-db = DataBase()
+async def refresh_bot_url():
+    # Посилання на бота для підписів; оновлюється у фоні, а не на кожен запит
+    while True:
+        await asyncio.sleep(config.BOT_IDENTITY_REFRESH_INTERVAL)
+        try:
+            dp["bot_url"] = f"t.me/{(await bot.get_me()).username}"
+        except Exception as e:
+            logging.warning("Could not refresh bot identity: %s", e)
 
-os.makedirs("downloads", exist_ok=True)
 
-
-async def send_analytics(user_id, chat_type, action_name):
-    params = {
-        'client_id': str(user_id),
-        'user_id': str(user_id),
-        'events': [{
-            'name': action_name,
-            'params': {
-                'chat_type': chat_type,
-                "session_id": str(user_id),
-                "engagement_time_msec": "1000"
-            }
-        }],
-    }
-    async with httpx.AsyncClient() as client:
-        await client.post(
-            f'https://www.google-analytics.com/mp/collect?measurement_id={MEASUREMENT_ID}&api_secret={API_SECRET}',
-            json=params)
+async def resume_mailings():
+    for mailing in await db.unfinished_mailings():
+        try:
+            await broadcaster.run(mailing, resumed=True)
+        except Exception as e:
+            logging.error("Mailing %s was not resumed: %s", mailing['id'], e)
 
 
 async def main():
@@ -61,13 +41,42 @@ async def main():
         dp.message.outer_middleware(middleware())
         dp.callback_query.outer_middleware(middleware())
         dp.inline_query.outer_middleware(middleware())
-    await bot.set_my_commands(commands=BOT_COMMANDS)
-    await bot.delete_webhook(drop_pending_updates=True)
-
-    await dp.start_polling(bot)
+    # Обробники business_message теж отримують profile, а заблоковані користувачі відсіюються
+    for middleware in (middlewares.ProfileMiddleware, middlewares.UserBannedMiddleware):
+        dp.business_message.outer_middleware(middleware())
+    # Незалежні запити під час старту виконуються одночасно
+    _, me, _, _ = await asyncio.gather(
+        db.connect(),
+        bot.get_me(),
+        bot.set_my_commands(commands=BOT_COMMANDS),
+        bot.delete_webhook(drop_pending_updates=True),
+    )
+    dp["bot_url"] = f"t.me/{me.username}"
+    metadata.load()
+    analytics.start()
+    user_updates.start()
+    media_store.start()
+    scratch.start()
+    instagram_sessions.start()
+    charts.start()
+    identity_refresh = asyncio.create_task(refresh_bot_url())
+    mailings = asyncio.create_task(resume_mailings())
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        identity_refresh.cancel()
+        mailings.cancel()
+        await analytics.close()
+        await user_updates.close()
+        await media_store.close()
+        await scratch.close()
+        await instagram_sessions.close()
+        metadata.save()
+        await db.close()
+        await http.close()
+        charts.close()
 
 
 if __name__ == "__main__":
-    import asyncio
-
     asyncio.run(main())
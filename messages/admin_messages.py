@@ -1,14 +1,22 @@
-def admin_panel(user_count, active_user_count, inactive_user_count):
+def admin_panel(user_count, active_user_count, inactive_user_count, file_cache_stats, scheduler_stats):
     return ("""<b>Hello, this is the admin panel.</b>
 
 🪪Number of bot users: <b>{user_count}</b>
 📱Number of active users: <b>{active_user_count}</b>
 📵Number of inactive users: <b>{inactive_user_count}</b>
 
+🗂File cache: <b>{size}/{maxsize}</b> entries
+✅Hits: <b>{hits}</b> | 🔎DB lookups: <b>{misses}</b> | ⏭Skipped: <b>{skipped}</b>
+
+📥Download queue: <b>{queued}</b> waiting, <b>{running}</b> running
+⏱Wait time: <b>{avg_wait:.1f}s</b> avg, <b>{max_wait:.1f}s</b> max
+
 <b>Admin commands:</b>
 Coming soon...""").format(user_count=user_count,
                           active_user_count=active_user_count,
-                          inactive_user_count=inactive_user_count, )
+                          inactive_user_count=inactive_user_count,
+                          **file_cache_stats,
+                          **scheduler_stats)
 
 
 def not_groups():
@@ -19,6 +27,18 @@ def finish_mailing():
     return ("Mailing is complete!")
 
 
+def mailing_progress(sent, failed, processed, total, resumed=False):
+    return (f"""{'🔁Resumed mailing' if resumed else '📨Mailing'} in progress...
+
+✅Sent: <b>{sent}</b>
+❌Failed: <b>{failed}</b>
+📊Processed: <b>{processed}/{total}</b>""")
+
+
+def stats_rebuilt():
+    return ("Download statistics have been rebuilt.")
+
+
 def start_mailing():
     return ("Starting mailing...")
 
@@ -24,5 +24,9 @@ def captions(user_captions, post_caption, bot_url):
         return ('<a href="{bot_url}">💻Powered by MaxLoad</a>').format(bot_url=bot_url)
 
 
+def download_queued(position):
+    return ("⏳Your download is queued, position: <b>{position}</b>").format(position=position)
+
+
 def join_group(chat_title):
     return ("Hi! Thank you for adding me to <b>'{chat_title}'</b>!\nHave a nice day!").format(chat_title=chat_title)
@@ -1,7 +1,9 @@
 from .antiflood import AntifloodMiddleware
 from .ban_middleware import UserBannedMiddleware
+from .profile import ProfileMiddleware
 
 __all__ = [
+    ProfileMiddleware,
     UserBannedMiddleware,
     AntifloodMiddleware,
-]
\ No newline at end of file
+]
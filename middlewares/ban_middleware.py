@@ -3,38 +3,26 @@ import asyncio
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, InlineQuery
 
-from main import db
-
 
 class UserBannedMiddleware(BaseMiddleware):
+    # Статус береться з профілю, який завантажив ProfileMiddleware
 
     async def on_pre_process_message(self, message: Message, data: dict):
-        try:
-            user_status = await db.status(message.from_user.id)
-        except:
-            user_status = 'active'
-        if user_status == 'ban':
-            if message.chat.type == 'private':
+        if data["profile"].status == 'ban':
+            # У бізнес-чатах нічого не відповідаємо від імені власника акаунта
+            if message.chat.type == 'private' and message.business_connection_id is None:
                 await message.answer(('You are banned please contact to @mak5er for more information!'),
                                      parse_mode='HTML')
             raise asyncio.CancelledError
 
     async def on_pre_process_callback_query(self, callback_query: CallbackQuery, data: dict):
-        try:
-            user_status = await db.status(callback_query.from_user.id)
-        except:
-            user_status = 'active'
-        if user_status == 'ban':
+        if data["profile"].status == 'ban':
             await callback_query.answer(('You are banned please contact to @mak5er for more information!'),
                                         show_alert=True)
             raise asyncio.CancelledError
 
     async def on_pre_process_inline_query(self, inline_query: InlineQuery, data: dict):
-        try:
-            user_status = await db.status(inline_query.from_user.id)
-        except:
-            user_status = 'active'
-        if user_status == 'ban':
+        if data["profile"].status == 'ban':
             raise asyncio.CancelledError
 
     async def __call__(self, handler, event, data):
@@ -0,0 +1,28 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from loader import db
+from services.db import UserProfile
+
+
+class ProfileMiddleware(BaseMiddleware):
+    """Loads the sender's profile (status, captions) once per update and passes it to handlers as ``profile``."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        profile = UserProfile(False)
+        if user is not None:
+            try:
+                profile = await db.get_profile(user.id)
+            except Exception as e:
+                logging.warning("Could not load profile of %s: %s", user.id, e)
+        data["profile"] = profile
+        return await handler(event, data)
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from collections import deque, OrderedDict
+from typing import Optional
+
+from services import http
+
+# The Measurement Protocol accepts up to 25 events per request, all for one client_id
+MAX_EVENTS_PER_REQUEST = 25
+
+
+class AnalyticsBuffer:
+    """Collects analytics events in memory and sends them in batches from a background task.
+
+    The queue is bounded: when it is full the oldest events are dropped.
+    """
+
+    def __init__(self, measurement_id: str, api_secret: str, max_queue: int, batch_size: int,
+                 flush_interval: float):
+        self.url = (f'https://www.google-analytics.com/mp/collect'
+                    f'?measurement_id={measurement_id}&api_secret={api_secret}')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._events = deque(maxlen=max_queue)
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def enqueue(self, user_id, chat_type, action_name):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append((str(user_id), {
+            'name': action_name,
+            'params': {
+                'chat_type': chat_type,
+                "session_id": str(user_id),
+                "engagement_time_msec": "1000"
+            }
+        }))
+        if len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # Не скасовуємо задачу посеред flush, інакше вже вибрані з черги події пропадуть
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        by_client = OrderedDict()
+        while self._events:
+            client_id, event = self._events.popleft()
+            by_client.setdefault(client_id, []).append(event)
+
+        for client_id, events in by_client.items():
+            for start in range(0, len(events), MAX_EVENTS_PER_REQUEST):
+                batch = events[start:start + MAX_EVENTS_PER_REQUEST]
+                try:
+                    await http.fetch(self.url, method="POST", json={
+                        'client_id': client_id,
+                        'user_id': client_id,
+                        'events': batch,
+                    })
+                    self.sent += len(batch)
+                except Exception as e:
+                    self.failed += len(batch)
+                    logging.warning("Analytics batch was not sent: %s", e)
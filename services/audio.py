@@ -0,0 +1,39 @@
+import asyncio
+import functools
+import logging
+import shutil
+
+import config
+
+
+@functools.lru_cache(maxsize=1)
+def ffmpeg_binary() -> str:
+    """ffmpeg from the config, from PATH or, failing that, the one bundled with moviepy."""
+    if config.FFMPEG_BINARY:
+        return config.FFMPEG_BINARY
+    binary = shutil.which("ffmpeg")
+    if binary:
+        return binary
+    import imageio_ffmpeg
+
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+async def extract_audio(source: str, target: str) -> bool:
+    """Copy the first audio track of ``source`` into the M4A file ``target`` without re-encoding.
+
+    ffmpeg only remuxes the packets, so this takes a fraction of a second even for long videos.
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            ffmpeg_binary(), "-nostdin", "-v", "error", "-y",
+            "-i", source, "-map", "0:a:0", "-c", "copy", "-movflags", "+faststart", target,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    except (ImportError, OSError) as e:
+        logging.warning("ffmpeg is not available: %s", e)
+        return False
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        logging.warning("Audio extraction from %s failed: %s", source, stderr.decode(errors="replace").strip())
+        return False
+    return True
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import messages as bm
+from services.db import DataBase
+
+
+class TokenBucket:
+    """Allows ``rate`` operations per second on average, with bursts of up to ``capacity``.
+
+    ``pause`` holds everyone back, e.g. when Telegram answers with RetryAfter.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    self.updated = time.monotonic()
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Broadcaster:
+    """Forwards a message to every user, resumable from the checkpoint stored in ``mailings``.
+
+    Recipients are streamed in ``user_id`` order and sent in batches; after each batch the
+    status changes are written in bulk and the last user id is saved, so a restart resends
+    at most one batch.
+    """
+
+    def __init__(self, bot: Bot, db: DataBase, rate: float, concurrency: int, batch_size: int,
+                 progress_interval: float):
+        self.bot = bot
+        self.db = db
+        self.bucket = TokenBucket(rate, capacity=rate)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+
+    async def _send(self, mailing, user_id) -> str:
+        """Forward to one user and return the outcome: sent, inactive, deleted or failed."""
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.bot.forward_message(chat_id=user_id,
+                                               from_chat_id=mailing['from_chat_id'],
+                                               message_id=mailing['message_id'])
+                return "sent"
+            except TelegramRetryAfter as e:
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError as e:
+                if "bots can't send messages to bots" in str(e):
+                    return "deleted"
+                # blocked by the user, deactivated or kicked from the group
+                return "inactive"
+            except TelegramBadRequest as e:
+                if "chat not found" in str(e).lower():
+                    return "inactive"
+                logging.warning("Mailing to %s failed: %s", user_id, e)
+                return "failed"
+            except Exception as e:
+                logging.warning("Mailing to %s failed: %s", user_id, e)
+                return "failed"
+
+    async def _send_batch(self, mailing, user_ids):
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def send(user_id):
+            async with limit:
+                return await self._send(mailing, user_id)
+
+        outcomes = await asyncio.gather(*(send(user_id) for user_id in user_ids))
+        by_outcome = {"sent": [], "inactive": [], "deleted": [], "failed": []}
+        for user_id, outcome in zip(user_ids, outcomes):
+            by_outcome[outcome].append(user_id)
+
+        await self.db.set_users_status(by_outcome["sent"], "active", only_status="inactive")
+        await self.db.set_users_status(by_outcome["inactive"], "inactive")
+        await self.db.delete_users(by_outcome["deleted"])
+        return len(by_outcome["sent"]), len(user_ids) - len(by_outcome["sent"])
+
+    async def run(self, mailing, resumed=False):
+        """Send ``mailing`` (a row of ``mailings``) and report progress to the admin who started it."""
+        admin_chat_id = mailing['admin_chat_id']
+        last_user_id, sent, failed = mailing['last_user_id'], mailing['sent'], mailing['failed']
+        total = await self.db.user_count()
+
+        progress = await self.bot.send_message(admin_chat_id,
+                                               bm.mailing_progress(sent, failed, sent + failed, total, resumed))
+        reported_at = time.monotonic()
+        batch = []
+
+        async def flush():
+            nonlocal last_user_id, sent, failed, reported_at
+            batch_sent, batch_failed = await self._send_batch(mailing, batch)
+            sent += batch_sent
+            failed += batch_failed
+            last_user_id = batch[-1]
+            await self.db.save_mailing_progress(mailing['id'], last_user_id, sent, failed)
+            batch.clear()
+
+            if time.monotonic() - reported_at >= self.progress_interval:
+                reported_at = time.monotonic()
+                try:
+                    await progress.edit_text(bm.mailing_progress(sent, failed, sent + failed, total, resumed))
+                except Exception as e:
+                    logging.warning("Could not update mailing progress: %s", e)
+
+        async for user_id in self.db.iter_user_ids(last_user_id):
+            batch.append(user_id)
+            if len(batch) >= self.batch_size:
+                await flush()
+        if batch:
+            await flush()
+
+        await self.db.save_mailing_progress(mailing['id'], last_user_id, sent, failed, finished=True)
+        try:
+            await progress.edit_text(bm.mailing_progress(sent, failed, sent + failed, total, resumed))
+        except Exception as e:
+            logging.warning("Could not update mailing progress: %s", e)
+        await self.bot.send_message(admin_chat_id, bm.finish_mailing())
@@ -0,0 +1,79 @@
+import hashlib
+import math
+from typing import Optional
+
+from cachetools import TTLCache
+
+
+class BloomFilter:
+    """Compact set membership test: no false negatives, a small rate of false positives."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class FileIdCache:
+    """LRU + TTL cache of (url, file type) -> Telegram file_id with a Bloom filter of every stored pair.
+
+    The file type is the variant of the media: the video, its audio track or another quality.
+
+    Until ``mark_ready`` is called (after the filter was filled from the database)
+    the filter is not trusted, so lookups fall through to the database.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, bloom_capacity: int, bloom_error_rate: float):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.known = BloomFilter(bloom_capacity, bloom_error_rate)
+        self.ready = False
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def mark_ready(self):
+        self.ready = True
+
+    @staticmethod
+    def key(url: str, file_type: str) -> str:
+        return f"{file_type}|{url}"
+
+    def get(self, url: str, file_type: str) -> Optional[str]:
+        file_id = self.entries.get(self.key(url, file_type))
+        if file_id is not None:
+            self.hits += 1
+        return file_id
+
+    def might_exist(self, url: str, file_type: str) -> bool:
+        if not self.ready or self.key(url, file_type) in self.known:
+            self.misses += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def set(self, url: str, file_type: str, file_id: str):
+        key = self.key(url, file_type)
+        self.entries[key] = file_id
+        self.known.add(key)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "maxsize": self.entries.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import io
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def render_chart(data: Dict[str, int], period: str) -> bytes:
+    """Draw the downloads chart and return it as PNG bytes. Runs in a worker process."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MaxNLocator
+
+    dates = list(data.keys())
+    counts = list(data.values())
+
+    # Обробка даних залежно від періоду
+    if period == 'Month':
+        # Вибір кожного 3-го дня для місячних даних
+        dates = dates[::3]
+        counts = counts[::3]
+
+    # Використання темної теми
+    plt.style.use('dark_background')
+    fig, ax = plt.subplots(figsize=(10, 5), facecolor='#2E2E2E')
+
+    # Побудова графіку з лінією, точками та прозорою заливкою
+    ax.plot(dates, counts, marker='o', color='#4CAF50', markersize=8, linewidth=2, label='Downloads')
+    ax.fill_between(dates, counts, color='#4CAF50', alpha=0.3)
+
+    # Заголовок і підписи осей
+    ax.set_title('Statistics of Downloaded Videos', fontsize=16, color='#FFFFFF')
+    ax.set_xlabel('Date', fontsize=12, color='#B0B0B0')
+    ax.set_ylabel('Number of Downloads', fontsize=12, color='#B0B0B0')
+
+    # Обмеження кількості міток на осі X
+    ax.xaxis.set_major_locator(MaxNLocator(8))
+
+    # Налаштування кольорів сітки, осей та тексту
+    ax.grid(True, color='#444444', linestyle='--', linewidth=0.5)
+    ax.spines['bottom'].set_color('#FFFFFF')
+    ax.spines['left'].set_color('#FFFFFF')
+    ax.tick_params(axis='x', colors='#B0B0B0')
+    ax.tick_params(axis='y', colors='#B0B0B0')
+
+    # Зображення з темним фоном зберігається в пам'ять
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', facecolor=fig.get_facecolor())
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def _warm_up():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # fork копіює процес разом із потоками asyncio.to_thread та їхніми блокуваннями
+        _executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _log_warm_up(future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        logging.error("Chart worker failed to start: %s", future.exception())
+
+
+def start():
+    """Start the worker process and import matplotlib there, so the first chart is not slow."""
+    get_executor().submit(_warm_up).add_done_callback(_log_warm_up)
+
+
+def close():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class Chart:
+    __slots__ = ("data", "png", "file_id")
+
+    def __init__(self, data: Dict[str, int], png: bytes):
+        self.data = data
+        self.png = png
+        self.file_id: Optional[str] = None  # set after the first upload
+
+
+class ChartCache:
+    """Rendered /stats charts per period.
+
+    The rollup is only queried again after a download was added (``db.stats_version``)
+    or the day changed, and the chart is only redrawn if the data actually differs.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._charts: Dict[str, Chart] = {}
+        self._checked: Dict[str, Tuple[int, datetime.date]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, period: str) -> Chart:
+        lock = self._locks.setdefault(period, asyncio.Lock())
+        async with lock:
+            stamp = (self.db.stats_version, datetime.date.today())
+            chart = self._charts.get(period)
+            if chart is not None and self._checked.get(period) == stamp:
+                return chart
+
+            data = await self.db.get_downloaded_files_count(period)
+            if chart is None or chart.data != data:
+                png = await asyncio.get_running_loop().run_in_executor(get_executor(), render_chart, data, period)
+                chart = self._charts[period] = Chart(data, png)
+            self._checked[period] = stamp
+            return chart
@@ -1,27 +1,101 @@
-from datetime import datetime, timedelta
+import asyncio
+import logging
+from datetime import timedelta
+from typing import NamedTuple, Optional
 
-import psycopg2
+import asyncpg
+from cachetools import TTLCache
 
 import config
+from services.cache import FileIdCache
+
+# Errors raised when a pooled connection was dropped (e.g. Postgres restart).
+# The pool replaces closed connections on the next acquire, so these are retried.
+RECONNECT_ERRORS = (
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.ConnectionDoesNotExistError,
+    asyncpg.exceptions.AdminShutdownError,
+    asyncpg.exceptions.CannotConnectNowError,
+    ConnectionError,
+    OSError,
+)
+
+STATS_PERIODS = {
+    'Week': timedelta(weeks=1),
+    'Month': timedelta(days=30),
+    'Year': timedelta(days=365),
+}
+
+
+class UserProfile(NamedTuple):
+    exists: bool
+    status: Optional[str] = None
+    captions: str = 'off'
+    user_name: Optional[str] = None
+    user_username: Optional[str] = None
 
 
 class DataBase:
 
     def __init__(self):
-        self.connect = psycopg2.connect(config.db_auth)
-        self.cursor = self.connect.cursor()
-        self.create_tables()
-
-    def create_tables(self):
+        self.pool: Optional[asyncpg.Pool] = None
+        self.file_cache = FileIdCache(
+            maxsize=config.FILE_CACHE_SIZE,
+            ttl=config.FILE_CACHE_TTL,
+            bloom_capacity=config.FILE_BLOOM_CAPACITY,
+            bloom_error_rate=config.FILE_BLOOM_ERROR_RATE,
+        )
+        # Профілі користувачів; скидаються при кожній зміні статусу, підписів чи імені
+        self.profiles = TTLCache(maxsize=config.PROFILE_CACHE_SIZE, ttl=config.PROFILE_CACHE_TTL)
+        # Збільшується з кожним add_file, щоб кеш графіків знав, коли перечитати статистику
+        self.stats_version = 0
+
+    async def connect(self):
+        # asyncpg prepares every parameterized query and keeps it in a per-connection
+        # statement cache, so the hot lookups run as prepared statements after first use.
+        self.pool = await asyncpg.create_pool(
+            config.db_auth,
+            min_size=config.DB_POOL_MIN_SIZE,
+            max_size=config.DB_POOL_MAX_SIZE,
+            statement_cache_size=config.DB_STATEMENT_CACHE_SIZE,
+            max_inactive_connection_lifetime=300,
+        )
+        await self.create_tables()
+        await self.load_file_cache()
+        await self.prune_short_links(timedelta(seconds=config.SHORT_LINK_TTL))
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _execute(self, method: str, query: str, *args, retry: bool = True):
+        """Run ``query`` on a pooled connection, retrying it after a lost connection.
+
+        Pass ``retry=False`` for statements that must not run twice: the connection may
+        drop after the server has already applied them.
+        """
+        attempts = config.DB_RETRY_ATTEMPTS if retry else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self.pool.acquire() as connection:
+                    return await getattr(connection, method)(query, *args)
+            except RECONNECT_ERRORS as e:
+                if attempt == attempts:
+                    raise
+                logging.warning("Database connection lost (%s), reconnecting (attempt %s)", e, attempt)
+                await asyncio.sleep(config.DB_RETRY_DELAY * attempt)
+
+    async def create_tables(self):
         create_downloaded_files_table = """
             CREATE TABLE IF NOT EXISTS public.downloaded_files (
                 id BIGINT GENERATED BY DEFAULT AS IDENTITY NOT NULL,
                 url TEXT NOT NULL,
                 file_id TEXT NOT NULL,
                 date_added TIMESTAMP WITH TIME ZONE NULL DEFAULT (now() AT TIME ZONE 'gmt+3'),
-                file_type TEXT NULL,
+                file_type TEXT NOT NULL DEFAULT 'video',
                 CONSTRAINT downloaded_files_pkey PRIMARY KEY (id),
-                CONSTRAINT downloaded_files_url_key UNIQUE (url)
+                CONSTRAINT downloaded_files_url_type_key UNIQUE (url, file_type)
             ) TABLESPACE pg_default;
             """
 
@@ -38,232 +112,324 @@ class DataBase:
             ) TABLESPACE pg_default;
             """
 
-        try:
+        create_mailings_table = """
+            CREATE TABLE IF NOT EXISTS public.mailings (
+                id BIGINT GENERATED BY DEFAULT AS IDENTITY NOT NULL,
+                admin_chat_id BIGINT NOT NULL,
+                from_chat_id BIGINT NOT NULL,
+                message_id BIGINT NOT NULL,
+                last_user_id BIGINT NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                finished BOOLEAN NOT NULL DEFAULT FALSE,
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                CONSTRAINT mailings_pkey PRIMARY KEY (id)
+            ) TABLESPACE pg_default;
+            """
 
-            with self.connect:
-                self.cursor.execute(create_downloaded_files_table)
-                self.cursor.execute(create_users_table)
-                print("Tables created or exist")
-        except psycopg2.OperationalError as e:
-            print(f"Error: {e}")
-            pass
+        # Денні підсумки завантажень для /stats, оновлюються в add_file
+        create_download_stats_table = """
+            CREATE TABLE IF NOT EXISTS public.download_stats_daily (
+                day DATE NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                CONSTRAINT download_stats_daily_pkey PRIMARY KEY (day)
+            ) TABLESPACE pg_default;
+            """
 
-    async def add_users(self, user_id, user_name, user_username, chat_type, language, status):
-        try:
-            with self.connect:
-                self.cursor.execute(
-                    """INSERT INTO users (user_id, user_name, user_username, chat_type, language, status) 
-                    VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (user_id) DO NOTHING;""",
-                    (user_id, user_name, user_username, chat_type, language, status))
+        # Розгорнуті короткі посилання (vm.tiktok.com, t.co), див. services/short_links.py
+        create_short_links_table = """
+            CREATE TABLE IF NOT EXISTS public.short_links (
+                url TEXT NOT NULL,
+                target TEXT NOT NULL,
+                resolved_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                CONSTRAINT short_links_pkey PRIMARY KEY (url)
+            ) TABLESPACE pg_default;
+            """
+
+        await self._execute('execute', create_downloaded_files_table)
+        if await self._execute('fetchval', "SELECT EXISTS (SELECT 1 FROM pg_constraint "
+                                           "WHERE conname = 'downloaded_files_url_key')"):
+            await self.migrate_downloaded_files()
+        await self._execute('execute', create_users_table)
+        await self._execute('execute', create_mailings_table)
+        await self._execute('execute', create_download_stats_table)
+        await self._execute('execute', create_short_links_table)
+        if not await self._execute('fetchval', "SELECT EXISTS (SELECT 1 FROM download_stats_daily)"):
+            await self.backfill_download_stats()
+        logging.info("Tables created or exist")
+
+    async def migrate_downloaded_files(self):
+        """Move ``downloaded_files`` from one row per url to one row per (url, file_type)."""
+        # Старі записи TikTok зберігались з ім'ям автора в посиланні; зводимо їх до канонічного
+        migration = r"""
+            UPDATE downloaded_files SET file_type = 'video' WHERE file_type IS NULL;
+            ALTER TABLE downloaded_files ALTER COLUMN file_type SET DEFAULT 'video';
+            ALTER TABLE downloaded_files ALTER COLUMN file_type SET NOT NULL;
+            ALTER TABLE downloaded_files DROP CONSTRAINT downloaded_files_url_key;
+            UPDATE downloaded_files
+            SET url = regexp_replace(url, '^https?://(www\.)?tiktok\.com/@[^/]*/(video|photo)/(\d+).*$',
+                                     'https://www.tiktok.com/@/\2/\3')
+            WHERE url ~ '^https?://(www\.)?tiktok\.com/@[^/]+/(video|photo)/\d+';
+            DELETE FROM downloaded_files AS older USING downloaded_files AS newer
+            WHERE older.url = newer.url AND older.file_type = newer.file_type AND older.id < newer.id;
+            ALTER TABLE downloaded_files
+                ADD CONSTRAINT downloaded_files_url_type_key UNIQUE (url, file_type);
+            """
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(migration)
+        logging.info("downloaded_files migrated to (url, file_type) keys")
+
+    async def load_file_cache(self):
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                async for url, file_type in connection.cursor("SELECT url, file_type FROM downloaded_files"):
+                    self.file_cache.known.add(self.file_cache.key(url, file_type))
+        self.file_cache.mark_ready()
 
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+    async def add_users(self, user_id, user_name, user_username, chat_type, language, status):
+        await self._execute(
+            'execute',
+            """INSERT INTO users (user_id, user_name, user_username, chat_type, language, status)
+            VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (user_id) DO NOTHING;""",
+            int(user_id), user_name, user_username, chat_type, language, status)
+        self.invalidate_profile(user_id)
+
+    async def upsert_users(self, rows):
+        """Insert or refresh many users at once; ``rows`` are (user_id, user_name, user_username).
+
+        Rows that would not change anything are not rewritten, and banned users stay banned.
+        """
+        await self._execute(
+            'execute',
+            """INSERT INTO users (user_id, user_name, user_username, chat_type, language, status)
+            SELECT u.user_id, u.user_name, u.user_username, 'private', 'uk', 'active'
+            FROM unnest($1::bigint[], $2::text[], $3::text[]) AS u (user_id, user_name, user_username)
+            ON CONFLICT (user_id) DO UPDATE
+            SET user_name = EXCLUDED.user_name, user_username = EXCLUDED.user_username, status = 'active'
+            WHERE users.status IS DISTINCT FROM 'ban'
+              AND (users.user_name, users.user_username, users.status)
+                  IS DISTINCT FROM (EXCLUDED.user_name, EXCLUDED.user_username, 'active')""",
+            [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows])
+        for row in rows:
+            self.invalidate_profile(row[0])
 
     async def delete_user(self, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute(
-                    "DELETE FROM users WHERE user_id = %s;",
-                    (user_id,))
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        await self._execute('execute', "DELETE FROM users WHERE user_id = $1;", int(user_id))
+        self.invalidate_profile(user_id)
 
     async def user_count(self):
-        try:
-            with self.connect:
-                self.cursor.execute("SELECT COUNT(*) FROM users")
-                return self.cursor.fetchone()[0]
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute('fetchval', "SELECT COUNT(*) FROM users")
 
     async def active_user_count(self):
-        try:
-            with self.connect:
-                self.cursor.execute("SELECT COUNT(*) FROM users WHERE status = 'active'")
-                return self.cursor.fetchone()[0]
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute('fetchval', "SELECT COUNT(*) FROM users WHERE status = 'active'")
 
     async def inactive_user_count(self):
-        try:
-            with self.connect:
-                self.cursor.execute("SELECT COUNT(*) FROM users WHERE status != 'active'")
-                return self.cursor.fetchone()[0]
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute('fetchval', "SELECT COUNT(*) FROM users WHERE status != 'active'")
 
     async def all_users(self):
-        try:
-            with self.connect:
-                self.cursor.execute("SELECT user_id FROM users")
-                return self.cursor.fetchall()
-
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute('fetch', "SELECT user_id FROM users")
+
+    async def iter_user_ids(self, after_user_id=0, page_size=1000):
+        """Yield user ids above ``after_user_id`` in order, fetched a page at a time.
+
+        Each page is a short query of its own, so a long mailing holds no connection or
+        transaction between pages and survives a database restart through ``_execute``.
+        """
+        last_user_id = int(after_user_id)
+        while True:
+            records = await self._execute(
+                'fetch', "SELECT user_id FROM users WHERE user_id > $1 ORDER BY user_id LIMIT $2",
+                last_user_id, page_size)
+            for record in records:
+                yield record[0]
+            if len(records) < page_size:
+                return
+            last_user_id = records[-1][0]
+
+    async def set_users_status(self, user_ids, status, only_status=None):
+        """Change the status of many users at once; with ``only_status``, only users currently in it.
+
+        Banned users keep their status.
+        """
+        if not user_ids:
+            return
+        await self._execute(
+            'execute',
+            """UPDATE users SET status = $1
+            WHERE user_id = ANY($2::bigint[]) AND status <> 'ban' AND ($3::text IS NULL OR status = $3)""",
+            status, [int(user_id) for user_id in user_ids], only_status)
+        for user_id in user_ids:
+            self.invalidate_profile(user_id)
+
+    async def delete_users(self, user_ids):
+        if not user_ids:
+            return
+        await self._execute('execute', "DELETE FROM users WHERE user_id = ANY($1::bigint[])",
+                            [int(user_id) for user_id in user_ids])
+        for user_id in user_ids:
+            self.invalidate_profile(user_id)
+
+    async def create_mailing(self, admin_chat_id, from_chat_id, message_id):
+        return await self._execute(
+            'fetchrow',
+            """INSERT INTO mailings (admin_chat_id, from_chat_id, message_id) VALUES ($1, $2, $3)
+            RETURNING *""",
+            int(admin_chat_id), int(from_chat_id), int(message_id), retry=False)
+
+    async def save_mailing_progress(self, mailing_id, last_user_id, sent, failed, finished=False):
+        await self._execute(
+            'execute',
+            """UPDATE mailings SET last_user_id = $2, sent = $3, failed = $4, finished = $5
+            WHERE id = $1""",
+            mailing_id, int(last_user_id), sent, failed, finished)
+
+    async def unfinished_mailings(self):
+        return await self._execute('fetch', "SELECT * FROM mailings WHERE NOT finished ORDER BY id")
 
     async def user_exist(self, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-                return self.cursor.fetchall()
-
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute('fetch', "SELECT * FROM users WHERE user_id = $1", int(user_id))
 
     async def user_update_name(self, user_id, user_name, user_username):
-        try:
-            with self.connect:
-                self.cursor.execute("UPDATE users SET user_username = %s, user_name = %s WHERE user_id = %s",
-                                    (user_username, user_name, user_id))
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        await self._execute('execute', "UPDATE users SET user_username = $1, user_name = $2 WHERE user_id = $3",
+                            user_username, user_name, int(user_id))
+        self.invalidate_profile(user_id)
+
+    async def get_profile(self, user_id) -> UserProfile:
+        """Status, captions and name of a user in one query, served from memory while cached."""
+        user_id = int(user_id)
+        profile = self.profiles.get(user_id)
+        if profile is not None:
+            return profile
+
+        row = await self._execute(
+            'fetchrow',
+            "SELECT status, captions, user_name, user_username FROM users WHERE user_id = $1",
+            user_id)
+        profile = UserProfile(True, *row) if row is not None else UserProfile(False)
+        self.profiles[user_id] = profile
+        return profile
+
+    def invalidate_profile(self, user_id):
+        self.profiles.pop(int(user_id), None)
 
     async def get_user_captions(self, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute("SELECT captions FROM users WHERE user_id = %s", (user_id,))
-                return self.cursor.fetchone()[0]
-
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return (await self.get_profile(user_id)).captions
 
     async def update_captions(self, captions, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute("UPDATE users SET captions = %s WHERE user_id = %s",
-                                    (captions, user_id))
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        await self._execute('execute', "UPDATE users SET captions = $1 WHERE user_id = $2", captions, int(user_id))
+        self.invalidate_profile(user_id)
 
     async def set_inactive(self, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute("UPDATE users SET status = %s WHERE user_id = %s", ("inactive", user_id))
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        await self._execute('execute', "UPDATE users SET status = $1 WHERE user_id = $2", "inactive", int(user_id))
+        self.invalidate_profile(user_id)
 
     async def set_active(self, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute("UPDATE users SET status = %s WHERE user_id = %s", ("active", user_id))
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        await self._execute('execute', "UPDATE users SET status = $1 WHERE user_id = $2", "active", int(user_id))
+        self.invalidate_profile(user_id)
 
     async def status(self, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute("SELECT DISTINCT status FROM users WHERE user_id = %s", (user_id,))
-                return self.cursor.fetchone()[0]
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute('fetchval', "SELECT DISTINCT status FROM users WHERE user_id = $1", int(user_id))
 
     async def get_user_info(self, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute(
-                    "SELECT user_name, user_username, status FROM users WHERE user_id = %s",
-                    (user_id,))
-                return self.cursor.fetchone()
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute(
+            'fetchrow',
+            "SELECT user_name, user_username, status FROM users WHERE user_id = $1",
+            int(user_id))
 
     async def get_user_info_username(self, user_username):
-        try:
-            with self.connect:
-                self.cursor.execute(
-                    "SELECT user_name, user_id, status FROM users WHERE user_username = %s",
-                    (user_username,))
-                return self.cursor.fetchone()
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute(
+            'fetchrow',
+            "SELECT user_name, user_id, status FROM users WHERE user_username = $1",
+            user_username)
 
     async def get_all_users_info(self):
-        try:
-            with self.connect:
-                self.cursor.execute(
-                    "SELECT user_id, chat_type, user_name, user_username, language, status, referrer_id FROM users")
-                return self.cursor.fetchall()
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        return await self._execute(
+            'fetch',
+            "SELECT user_id, chat_type, user_name, user_username, language, status, referrer_id FROM users")
 
     async def ban_user(self, user_id):
-        try:
-            with self.connect:
-                self.cursor.execute("UPDATE users SET status = %s WHERE user_id = %s", ("ban", user_id))
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        await self._execute('execute', "UPDATE users SET status = $1 WHERE user_id = $2", "ban", int(user_id))
+        self.invalidate_profile(user_id)
 
     async def add_file(self, url, file_id, file_type):
-        try:
-            with self.connect:
-                self.cursor.execute("INSERT INTO downloaded_files (url, file_id, file_type) VALUES (%s, %s, %s)",
-                                    (url, file_id, file_type))
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
-
-    async def get_file_id(self, url):
-        try:
-            with self.connect:
-                self.cursor.execute("SELECT file_id FROM downloaded_files WHERE url = %s", (url,))
-                return self.cursor.fetchall()
-        except psycopg2.OperationalError as e:
-            print(e)
-            pass
+        # xmax = 0 only for freshly inserted rows, so a re-upload is not counted twice.
+        # /stats counts videos only; audio from the MP3 buttons is not a new download.
+        await self._execute(
+            'execute',
+            """WITH upsert AS (
+                INSERT INTO downloaded_files (url, file_id, file_type) VALUES ($1, $2, $3)
+                ON CONFLICT (url, file_type) DO UPDATE SET file_id = EXCLUDED.file_id
+                RETURNING date_added, xmax = 0 AS inserted
+            )
+            INSERT INTO download_stats_daily (day, count)
+            SELECT DATE(date_added), 1 FROM upsert WHERE inserted AND date_added IS NOT NULL AND $3 = 'video'
+            ON CONFLICT (day) DO UPDATE SET count = download_stats_daily.count + 1""",
+            url, file_id, file_type)
+        self.file_cache.set(url, file_type, file_id)
+        if file_type == "video":
+            self.stats_version += 1
+
+    async def get_short_link(self, url, max_age: timedelta):
+        return await self._execute('fetchval',
+                                   "SELECT target FROM short_links WHERE url = $1 AND resolved_at > now() - $2",
+                                   url, max_age)
+
+    async def save_short_link(self, url, target):
+        await self._execute('execute',
+                            """INSERT INTO short_links (url, target) VALUES ($1, $2)
+                            ON CONFLICT (url) DO UPDATE SET target = EXCLUDED.target, resolved_at = now()""",
+                            url, target)
+
+    async def prune_short_links(self, max_age: timedelta):
+        await self._execute('execute', "DELETE FROM short_links WHERE resolved_at < now() - $1", max_age)
+
+    async def get_file_id(self, url, file_type="video"):
+        file_id = self.file_cache.get(url, file_type)
+        if file_id is not None:
+            return file_id
+        if not self.file_cache.might_exist(url, file_type):
+            return None
+
+        file_id = await self._execute('fetchval',
+                                      "SELECT file_id FROM downloaded_files WHERE url = $1 AND file_type = $2",
+                                      url, file_type)
+        if file_id is not None:
+            self.file_cache.set(url, file_type, file_id)
+        return file_id
+
+    async def backfill_download_stats(self):
+        """Rebuild the daily rollup from ``downloaded_files``."""
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute("DELETE FROM download_stats_daily")
+                await connection.execute(
+                    """INSERT INTO download_stats_daily (day, count)
+                    SELECT DATE(date_added), COUNT(*) FROM downloaded_files
+                    WHERE date_added IS NOT NULL AND file_type = 'video'
+                    GROUP BY DATE(date_added)""")
+        self.stats_version += 1
+        logging.info("Download statistics rebuilt")
 
     async def get_downloaded_files_count(self, period: str):
-        try:
-            with self.connect:
-                if period == 'Week':
-                    start_date = datetime.now() - timedelta(weeks=1)
-                    query = """
-                    SELECT DATE(date_added) AS date, COUNT(*) 
-                    FROM downloaded_files 
-                    WHERE date_added >= %s 
-                    GROUP BY DATE(date_added)
-                    ORDER BY DATE(date_added)
-                    """
-                    self.cursor.execute(query, (start_date,))
-                elif period == 'Month':
-                    start_date = datetime.now() - timedelta(days=30)
-                    query = """
-                    SELECT DATE(date_added) AS date, COUNT(*) 
-                    FROM downloaded_files 
-                    WHERE date_added >= %s 
-                    GROUP BY DATE(date_added)
-                    ORDER BY DATE(date_added)
-                    """
-                    self.cursor.execute(query, (start_date,))
-                elif period == 'Year':
-                    start_date = datetime.now() - timedelta(days=365)
-                    query = """
-                    SELECT DATE(date_added) AS date, COUNT(*) 
-                    FROM downloaded_files 
-                    WHERE date_added >= %s 
-                    GROUP BY DATE(date_added)
-                    ORDER BY DATE(date_added)
-                    """
-                    self.cursor.execute(query, (start_date,))
-
-                result = self.cursor.fetchall()
-                # Перетворюємо результат у потрібний формат
-                return {row[0].strftime('%Y-%m-%d'): row[1] for row in result}
-        except Exception as e:
-            print("Error:", e)
+        """Downloads per day, or per month ('YYYY-MM') for the Year period."""
+        if period == 'Year':
+            query = """
+            SELECT to_char(date_trunc('month', day), 'YYYY-MM'), SUM(count)::int
+            FROM download_stats_daily
+            WHERE day >= (now() - $1::interval)::date
+            GROUP BY 1
+            ORDER BY 1
+            """
+            result = await self._execute('fetch', query, STATS_PERIODS[period])
+            return {row[0]: row[1] for row in result}
+
+        query = """
+        SELECT day, count
+        FROM download_stats_daily
+        WHERE day >= (now() - $1::interval)::date
+        ORDER BY day
+        """
+        result = await self._execute('fetch', query, STATS_PERIODS[period])
+        # Перетворюємо результат у потрібний формат
+        return {row[0].strftime('%Y-%m-%d'): row[1] for row in result}
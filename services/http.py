@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+import config
+
+_client: Optional[httpx.AsyncClient] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared client: connections are kept alive per origin and reused across requests."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=config.HTTP2_ENABLED,
+            follow_redirects=True,
+            timeout=httpx.Timeout(
+                connect=config.HTTP_CONNECT_TIMEOUT,
+                read=config.HTTP_READ_TIMEOUT,
+                write=config.HTTP_READ_TIMEOUT,
+                pool=config.HTTP_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def fetch(url: str, method: str = "GET", **kwargs) -> httpx.Response:
+    """Send a request and read the whole body."""
+    return await get_client().request(method, url, **kwargs)
+
+
+@asynccontextmanager
+async def stream(url: str, method: str = "GET", **kwargs):
+    """Send a request and yield the response with its body still unread."""
+    async with get_client().stream(method, url, **kwargs) as response:
+        yield response
+
+
+async def download(url: str, path: str, chunk_size: int = 64 * 1024, **kwargs) -> httpx.Response:
+    """Stream the body of ``url`` into ``path``. Raises ``httpx.HTTPStatusError`` on error responses."""
+    async with stream(url, **kwargs) as response:
+        response.raise_for_status()
+        with open(path, "wb") as file:
+            async for chunk in response.aiter_bytes(chunk_size):
+                file.write(chunk)
+    return response
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).hostname or ""
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = asyncio.Semaphore(config.HTTP_PER_HOST_CONCURRENCY)
+    return limit
+
+
+async def _download_with_retry(url: str, path: str, retries: int) -> str:
+    for attempt in range(retries + 1):
+        try:
+            await download(url, path)
+            return path
+        except httpx.HTTPStatusError as e:
+            # 4xx will not get better on retry
+            if e.response.status_code < 500 or attempt == retries:
+                raise
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(config.MEDIA_FETCH_RETRY_DELAY * 2 ** attempt)
+
+
+async def download_many(items: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                        retries: Optional[int] = None, return_exceptions: bool = False) -> list:
+    """Download ``(url, path)`` pairs concurrently, at most ``HTTP_PER_HOST_CONCURRENCY`` per host.
+
+    Results are in the order of ``items``: the path, or the exception if ``return_exceptions`` is set.
+    """
+    limit = asyncio.Semaphore(concurrency or config.MEDIA_FETCH_CONCURRENCY)
+    retries = config.MEDIA_FETCH_RETRIES if retries is None else retries
+
+    async def fetch_one(url, path):
+        async with limit, _host_limit(url):
+            return await _download_with_retry(url, path, retries)
+
+    # Чекаємо на всі завантаження, щоб жодне не писало в каталог, який уже видаляють
+    results = await asyncio.gather(*(fetch_one(url, path) for url, path in items), return_exceptions=True)
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+    return results
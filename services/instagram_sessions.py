@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+
+class InstagramAccount:
+    """One logged-in Instaloader with its own request budget (a token bucket)."""
+
+    def __init__(self, login: str, password: str, budget: int, window: float):
+        self.login = login
+        self.password = password
+        self.loader = None
+        self.healthy = False
+        self.cooldown_until = 0.0
+
+        self.capacity = budget
+        self.rate = budget / window
+        self.tokens = float(budget)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available_in(self, now: float) -> float:
+        """Seconds until this account may send a request (0 if it can right away)."""
+        if not self.healthy:
+            return float("inf")
+        self._refill(now)
+        wait = max(0.0, self.cooldown_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+
+class InstagramSessionManager:
+    """Keeps a pool of Instagram accounts logged in and hands out the least used one.
+
+    Accounts log in once at start (from the saved session file when possible) and a
+    background task checks every session, logging in again if it expired. An account
+    that hits a rate limit cools down while the others keep serving requests. A request
+    that would wait longer than ``acquire_timeout`` for an account fails instead.
+    """
+
+    def __init__(self, accounts: List[Tuple[str, str]], budget: int, window: float,
+                 health_interval: float, cooldown: float, acquire_timeout: float,
+                 notify: Callable[[str], Awaitable]):
+        self.accounts = [InstagramAccount(login, password, budget, window) for login, password in accounts]
+        self.health_interval = health_interval
+        self.cooldown = cooldown
+        self.acquire_timeout = acquire_timeout
+        self.notify = notify
+
+        self._code: Optional[asyncio.Future] = None
+        self._two_factor_lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._relogins = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        await asyncio.gather(*(self._login(account) for account in self.accounts))
+        self._ready.set()
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for account in self.accounts:
+                await self._check(account)
+
+    async def _check(self, account: InstagramAccount):
+        if account.loader is not None:
+            try:
+                if await asyncio.to_thread(account.loader.test_login) == account.login:
+                    account.healthy = True
+                    return
+            except Exception as e:
+                logging.warning("Instagram session check failed for %s: %s", account.login, e)
+        account.healthy = False
+        await self._login(account)
+
+    async def _login(self, account: InstagramAccount):
+        import instaloader
+        from instaloader.exceptions import TwoFactorAuthRequiredException
+
+        loader = await asyncio.to_thread(instaloader.Instaloader)
+        try:
+            await asyncio.to_thread(loader.load_session_from_file, account.login)
+            if await asyncio.to_thread(loader.test_login) != account.login:
+                raise ValueError("saved session has expired")
+            logging.info("Instagram: %s logged in with session", account.login)
+        except Exception as e:
+            logging.info("Instagram: no usable session for %s (%s), logging in", account.login, e)
+            try:
+                loader = await asyncio.to_thread(instaloader.Instaloader)
+                try:
+                    await asyncio.to_thread(loader.login, account.login, account.password)
+                except TwoFactorAuthRequiredException:
+                    code = await self._request_code(account.login)
+                    await asyncio.to_thread(loader.two_factor_login, code)
+                await asyncio.to_thread(loader.save_session_to_file)
+                logging.info("Instagram: %s logged in", account.login)
+            except Exception as e:
+                logging.error("Instagram login failed for %s: %s", account.login, e)
+                return
+
+        account.loader = loader
+        account.healthy = True
+        # Не чекаємо на решту акаунтів (наприклад, на код 2FA), щоб почати обслуговувати запити
+        self._ready.set()
+
+    async def _request_code(self, login: str) -> str:
+        # Коди запитуються по одному, щоб /ig_code було однозначним
+        async with self._two_factor_lock:
+            self._code = asyncio.get_running_loop().create_future()
+            try:
+                await self.notify(f"Enter Instagram 2FA code for {login} by command /ig_code code")
+                return await self._code
+            finally:
+                self._code = None
+
+    def submit_code(self, code: str) -> bool:
+        """Pass a 2FA code from the admin to the login waiting for it."""
+        if self._code is None or self._code.done():
+            return False
+        self._code.set_result(code)
+        return True
+
+    async def _acquire(self) -> InstagramAccount:
+        deadline = time.monotonic() + self.acquire_timeout
+        try:
+            await asyncio.wait_for(self._ready.wait(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError("No Instagram account has logged in yet") from None
+        while True:
+            now = time.monotonic()
+            waits = [(account.available_in(now), -account.tokens, index)
+                     for index, account in enumerate(self.accounts)]
+            wait, _, index = min(waits)
+            if wait == float("inf"):
+                raise RuntimeError("No Instagram account is logged in")
+            if wait == 0:
+                account = self.accounts[index]
+                account.tokens -= 1
+                return account
+            # Краще одразу відмовити, ніж тримати запит, поки всі акаунти відпочивають
+            if now + wait > deadline:
+                raise RuntimeError(f"No Instagram account is available for {wait:.0f} s")
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def session(self):
+        """Yield the Instaloader of the account with the most budget left."""
+        from instaloader.exceptions import (ConnectionException, LoginRequiredException,
+                                            TooManyRequestsException)
+
+        account = await self._acquire()
+        try:
+            yield account.loader
+        except TooManyRequestsException:
+            account.cooldown_until = time.monotonic() + self.cooldown
+            logging.warning("Instagram: %s is rate limited, cooling down", account.login)
+            raise
+        except LoginRequiredException:
+            account.healthy = False
+            task = asyncio.create_task(self._login(account))
+            self._relogins.add(task)
+            task.add_done_callback(self._relogins.discard)
+            raise
+        except ConnectionException as e:
+            if "429" in str(e) or "wait a few minutes" in str(e):
+                account.cooldown_until = time.monotonic() + self.cooldown
+                logging.warning("Instagram: %s is rate limited, cooling down", account.login)
+            raise
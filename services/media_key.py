@@ -0,0 +1,118 @@
+import re
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit, parse_qs
+
+YOUTUBE_HOSTS = {"youtube.com", "youtube-nocookie.com", "youtu.be"}
+TIKTOK_HOSTS = {"tiktok.com"}
+TIKTOK_SHORT_HOSTS = {"vm.tiktok.com", "vt.tiktok.com", "vn.tiktok.com"}
+INSTAGRAM_HOSTS = {"instagram.com"}
+TWITTER_HOSTS = {"twitter.com", "x.com"}
+TWITTER_SHORT_HOSTS = {"t.co"}
+
+YOUTUBE_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+YOUTUBE_PATH = re.compile(r"^/(?:shorts|embed|live|v|e)/([A-Za-z0-9_-]{11})")
+TIKTOK_PATH = re.compile(r"^/(?:@[^/]*/)?(video|photo)/(\d+)")
+TIKTOK_LEGACY_PATH = re.compile(r"^/v/(\d+)(?:\.html)?")
+INSTAGRAM_PATH = re.compile(r"^/(?:[A-Za-z0-9_.]+/)?(p|reel|reels|tv)/([A-Za-z0-9_-]+)")
+TWITTER_PATH = re.compile(r"^/(?:[A-Za-z0-9_]{1,15}|i(?:/web)?)/status(?:es)?/(\d{1,20})")
+
+URL_PATTERN = re.compile(r"(?:https?://)?(?:[\w-]+\.)+\w+/\S*")
+
+
+class MediaKey(NamedTuple):
+    """Canonical identity of a piece of media: the same post always maps to the same key."""
+    platform: str
+    id: str
+    variant: str = "video"
+
+    @property
+    def url(self) -> str:
+        """Canonical url of the media, used as the ``downloaded_files`` key."""
+        if self.platform == "youtube":
+            return f"https://youtube.com/watch?v={self.id}"
+        if self.platform == "tiktok":
+            return f"https://www.tiktok.com/@/{self.variant}/{self.id}"
+        if self.platform == "instagram":
+            return f"https://www.instagram.com/reel/{self.id}"
+        if self.platform == "twitter":
+            return f"https://x.com/i/status/{self.id}"
+        raise ValueError(f"Unknown platform: {self.platform}")
+
+    def __str__(self):
+        return f"{self.platform}:{self.id}:{self.variant}"
+
+
+def _split(url: str):
+    if "://" not in url:
+        url = "https://" + url
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    return host, parts.path, parts.query
+
+
+def _base_host(host: str) -> str:
+    for prefix in ("www.", "m.", "mobile.", "music."):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def is_short_link(url: str) -> bool:
+    """Short links (vm.tiktok.com, t.co, ...) need a redirect lookup before they can be keyed."""
+    host, path, _ = _split(url)
+    if host in TIKTOK_SHORT_HOSTS or host in TWITTER_SHORT_HOSTS:
+        return True
+    return _base_host(host) in TIKTOK_HOSTS and path.startswith("/t/")
+
+
+def resolve_media_key(url: str) -> Optional[MediaKey]:
+    """Map a link to its canonical key without any network access.
+
+    Returns None for short links and for links that do not point to a single media item.
+    """
+    if is_short_link(url):
+        return None
+
+    host, path, query = _split(url)
+    base_host = _base_host(host)
+
+    if base_host in YOUTUBE_HOSTS:
+        variant = "audio" if host.startswith("music.") else "video"
+        if base_host == "youtu.be":
+            video_id = path.strip("/").split("/")[0]
+        elif path.startswith("/watch"):
+            video_id = parse_qs(query).get("v", [""])[0]
+        else:
+            match = YOUTUBE_PATH.match(path)
+            video_id = match.group(1) if match else ""
+        if YOUTUBE_ID.match(video_id):
+            return MediaKey("youtube", video_id, variant)
+        return None
+
+    if base_host in TIKTOK_HOSTS:
+        match = TIKTOK_PATH.match(path)
+        if match:
+            return MediaKey("tiktok", match.group(2), match.group(1))
+        match = TIKTOK_LEGACY_PATH.match(path)
+        if match:
+            return MediaKey("tiktok", match.group(1), "video")
+        return None
+
+    if base_host in INSTAGRAM_HOSTS:
+        match = INSTAGRAM_PATH.match(path)
+        if match:
+            variant = "post" if match.group(1) == "p" else "video"
+            return MediaKey("instagram", match.group(2), variant)
+        return None
+
+    if base_host in TWITTER_HOSTS:
+        match = TWITTER_PATH.match(path)
+        if match:
+            return MediaKey("twitter", match.group(1), "post")
+        return None
+
+    return None
+
+
+def find_urls(text: str) -> list:
+    return URL_PATTERN.findall(text or "")
@@ -0,0 +1,286 @@
+import logging
+import os
+import struct
+from typing import Iterator, NamedTuple, Optional, Tuple, Union
+
+# moov is normally well under this; anything bigger is not worth parsing in memory
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    duration: Optional[int]  # whole seconds, as the Bot API expects
+
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload_start, box_end) for every complete box in ``data[start:end]``."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _find_box(data: bytes, box_type: bytes, start: int = 0, end: Optional[int] = None):
+    for found_type, payload, box_end in _iter_boxes(data, start, end):
+        if found_type == box_type:
+            return payload, box_end
+    return None
+
+
+def _read_duration(data: bytes, payload: int) -> Optional[float]:
+    """Duration in seconds from an mvhd or mdhd box."""
+    version = data[payload]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, payload + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, payload + 12)
+    if not timescale or duration in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        return None
+    return duration / timescale
+
+
+def _read_tkhd_size(data: bytes, payload: int) -> Tuple[int, int]:
+    version = data[payload]
+    # version/flags + (v1: 32 | v0: 20) bytes of times and ids + 16 reserved/layer/volume bytes
+    matrix_offset = payload + (36 if version == 1 else 24) + 16
+    a, b, _, c, d = struct.unpack_from(">iiiii", data, matrix_offset)
+    width, height = struct.unpack_from(">II", data, matrix_offset + 36)
+    width, height = width >> 16, height >> 16
+    # 90/270 degree rotation is stored in the matrix, Telegram expects display size
+    if a == 0 and d == 0 and b != 0 and c != 0:
+        width, height = height, width
+    return width, height
+
+
+def _handler_type(data: bytes, trak_payload: int, trak_end: int) -> Optional[bytes]:
+    mdia = _find_box(data, b"mdia", trak_payload, trak_end)
+    if mdia is None:
+        return None
+    hdlr = _find_box(data, b"hdlr", *mdia)
+    if hdlr is None:
+        return None
+    return data[hdlr[0] + 8:hdlr[0] + 12]
+
+
+def parse_moov(data: bytes, start: int = 0, end: Optional[int] = None) -> Optional[VideoInfo]:
+    """Read video size and duration from the payload of a moov box."""
+    duration = None
+    mvhd = _find_box(data, b"mvhd", start, end)
+    if mvhd is not None:
+        duration = _read_duration(data, mvhd[0])
+
+    for box_type, payload, box_end in _iter_boxes(data, start, end):
+        if box_type != b"trak":
+            continue
+        tkhd = _find_box(data, b"tkhd", payload, box_end)
+        if tkhd is None:
+            continue
+        width, height = _read_tkhd_size(data, tkhd[0])
+        if width and height and _handler_type(data, payload, box_end) in (b"vide", None):
+            return VideoInfo(width, height, round(duration) if duration is not None else None)
+    return None
+
+
+def probe_mp4_header(data: bytes) -> Optional[VideoInfo]:
+    """Probe the first bytes of an MP4 (e.g. a streaming download). Needs a complete moov box."""
+    moov = _find_box(data, b"moov")
+    if moov is None:
+        return None
+    return parse_moov(data, *moov)
+
+
+def mdat_before_moov(data: bytes) -> bool:
+    """True if the top-level mdat box starts before moov, i.e. the header will not fit in a prefix."""
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        if box_type == b"moov":
+            return False
+        if box_type == b"mdat":
+            return True
+        if size == 1:
+            if offset + 16 > len(data):
+                return False
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+def read_moov(path: str) -> Optional[bytes]:
+    """Return the payload of the top-level moov box, seeking over mdat instead of reading it."""
+    with open(path, "rb") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        offset = 0
+        while offset + 8 <= file_size:
+            file.seek(offset)
+            header = file.read(16)
+            size, box_type = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - offset
+            if size < header_size:
+                return None
+            if box_type == b"moov":
+                if size > MAX_MOOV_SIZE:
+                    return None
+                file.seek(offset + header_size)
+                return file.read(size - header_size)
+            offset += size
+    return None
+
+
+def probe_mp4(path: str) -> Optional[VideoInfo]:
+    try:
+        moov = read_moov(path)
+        return parse_moov(moov) if moov else None
+    except (OSError, struct.error, IndexError) as e:
+        logging.warning("MP4 probe failed for %s: %s", path, e)
+        return None
+
+
+def get_video_info(path: str) -> Union[VideoInfo, Tuple[None, None, None]]:
+    """Video size and duration, from the MP4 header or, if that fails, from moviepy."""
+    info = probe_mp4(path)
+    if info is not None:
+        return info
+
+    try:
+        from moviepy.editor import VideoFileClip
+
+        with VideoFileClip(path) as clip:
+            width, height = clip.size
+            return VideoInfo(width, height, round(clip.duration))
+    except Exception as e:
+        logging.warning("Could not read video info for %s: %s", path, e)
+        return None, None, None
+
+
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+MP3_SCAN_LIMIT = 64 * 1024
+
+
+def _parse_mp3_frame_header(header: int):
+    """Return (version, bitrate, sample_rate, mono) for a valid MPEG Layer III frame header."""
+    if header >> 21 != 0x7FF:
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}.get((header >> 19) & 3)
+    layer = (header >> 17) & 3
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 3
+    if version is None or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    mono = (header >> 6) & 3 == 3
+    return version, bitrate, sample_rate, mono
+
+
+def probe_mp3_duration(path: str) -> Optional[float]:
+    """Duration from the Xing/Info or VBRI header of the first frame, or from the bitrate for CBR files."""
+    with open(path, "rb") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        data = file.read(MP3_SCAN_LIMIT)
+
+        audio_start = 0
+        if data[:3] == b"ID3" and len(data) >= 10:
+            # ID3v2 size is a 28-bit syncsafe integer; tags with cover art can be large
+            size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+            audio_start = 10 + size + (10 if data[5] & 0x10 else 0)
+            file.seek(audio_start)
+            data = file.read(MP3_SCAN_LIMIT)
+
+    for offset in range(len(data) - 4):
+        if data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+            continue
+        frame = _parse_mp3_frame_header(struct.unpack_from(">I", data, offset)[0])
+        if frame is None:
+            continue
+        version, bitrate, sample_rate, mono = frame
+        samples_per_frame = 1152 if version == 1 else 576
+
+        if version == 1:
+            side_info = 17 if mono else 32
+        else:
+            side_info = 9 if mono else 17
+        xing = offset + 4 + side_info
+        if data[xing:xing + 4] in (b"Xing", b"Info") and len(data) >= xing + 12:
+            flags = struct.unpack_from(">I", data, xing + 4)[0]
+            if flags & 1:
+                frames = struct.unpack_from(">I", data, xing + 8)[0]
+                return frames * samples_per_frame / sample_rate
+
+        vbri = offset + 4 + 32
+        if data[vbri:vbri + 4] == b"VBRI" and len(data) >= vbri + 18:
+            frames = struct.unpack_from(">I", data, vbri + 14)[0]
+            return frames * samples_per_frame / sample_rate
+
+        return (file_size - audio_start - offset) * 8 / bitrate
+    return None
+
+
+def probe_mp4_audio_duration(path: str) -> Optional[float]:
+    """Duration of the audio track (mdhd), or of the whole movie (mvhd)."""
+    data = read_moov(path)
+    if not data:
+        return None
+    for box_type, payload, box_end in _iter_boxes(data):
+        if box_type != b"trak" or _handler_type(data, payload, box_end) != b"soun":
+            continue
+        mdia = _find_box(data, b"mdia", payload, box_end)
+        mdhd = _find_box(data, b"mdhd", *mdia)
+        if mdhd is not None:
+            return _read_duration(data, mdhd[0])
+    mvhd = _find_box(data, b"mvhd")
+    return _read_duration(data, mvhd[0]) if mvhd is not None else None
+
+
+def get_audio_duration(path: str) -> Optional[int]:
+    """Audio duration in whole seconds, detected from the file content rather than its extension."""
+    duration = None
+    try:
+        with open(path, "rb") as file:
+            head = file.read(12)
+        if head[4:8] == b"ftyp":
+            duration = probe_mp4_audio_duration(path)
+        elif head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+            duration = probe_mp3_duration(path)
+    except (OSError, struct.error, IndexError, TypeError) as e:
+        logging.warning("Audio probe failed for %s: %s", path, e)
+
+    if duration is not None:
+        return round(duration)
+
+    try:
+        from moviepy.editor import AudioFileClip
+
+        with AudioFileClip(path) as clip:
+            return round(clip.duration)
+    except Exception as e:
+        logging.warning("Could not read audio duration for %s: %s", path, e)
+        return None
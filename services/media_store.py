@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from services.media_key import MediaKey
+from services.scratch import ScratchSpace
+
+
+class MediaStore:
+    """Recently downloaded videos kept on disk for a short while.
+
+    The audio button under a video usually comes seconds after the video itself, so its
+    track can be cut from the local file instead of being downloaded again. Files older
+    than ``ttl`` are removed by a background sweep, and the oldest ones go first when the
+    store grows past ``max_bytes``. Writes reserve their size from the shared scratch
+    budget, so the largest downloads wait for disk like every other job.
+    """
+
+    def __init__(self, directory: str, ttl: float, max_bytes: int, sweep_interval: float, scratch: ScratchSpace):
+        self.directory = directory
+        self.scratch = scratch
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, media_key: MediaKey) -> str:
+        return os.path.join(self.directory, f"{media_key.platform}_{media_key.id}.mp4")
+
+    def get(self, media_key: MediaKey) -> Optional[str]:
+        """Path of the stored video, or None if it is missing or expired."""
+        path = self.path(media_key)
+        try:
+            fresh = os.path.getmtime(path) + self.ttl > time.time()
+        except OSError:
+            fresh = False
+        if not fresh:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    @asynccontextmanager
+    async def keep(self, media_key: Optional[MediaKey], name: str = "media.mp4", size: Optional[int] = None):
+        """Yield a temporary path to download to; the file joins the store if the block succeeds.
+
+        Without a media key there is nothing to store it under, so it is just removed.
+        """
+        async with self.scratch.reserve(size):
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}_{name}")
+            try:
+                yield temp_path
+                if media_key is not None and os.path.exists(temp_path):
+                    os.replace(temp_path, self.path(media_key))
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        # Ліміт сховища тримаємо одразу, а не лише на наступному проході sweep
+        await asyncio.to_thread(self.sweep)
+
+    def sweep(self):
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            # Недописані файли теж мають mtime, тож покинуті після збою приберуться так само
+            if stat.st_mtime + self.ttl <= now:
+                self._remove(entry.path)
+            elif not entry.name.startswith("."):
+                # Тимчасові файли ще пишуться, їх місце вже зарезервоване в scratch
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.warning("Could not remove %s: %s", path, e)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logging.error("Media store sweep failed: %s", e)
+            await asyncio.sleep(self.sweep_interval)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
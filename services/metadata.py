@@ -0,0 +1,108 @@
+import logging
+import os
+import pickle
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import LRUCache
+
+from services.media_key import MediaKey
+from services.singleflight import SingleFlight
+
+
+class MetadataCache:
+    """Source metadata (stream lists, post media, API responses) keyed by canonical media id.
+
+    Entries expire after a per-platform TTL, since media URLs in them are signed and
+    short-lived, and the least recently used ones are evicted beyond ``maxsize``.
+    Concurrent lookups of the same id share one fetch. With ``path`` set, entries that
+    can be pickled survive a restart.
+    """
+
+    def __init__(self, maxsize: int, ttls: Dict[str, int], default_ttl: int, path: Optional[str] = None):
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.path = path
+        self.entries: LRUCache = LRUCache(maxsize=maxsize)
+        self._in_flight = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(media_key: MediaKey) -> Tuple[str, str]:
+        # Відео та аудіо одного ролика мають спільні метадані
+        return media_key.platform, media_key.id
+
+    def get(self, media_key: MediaKey) -> Any:
+        key = self._key(media_key)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            return None
+        return value
+
+    def set(self, media_key: MediaKey, value: Any):
+        ttl = self.ttls.get(media_key.platform, self.default_ttl)
+        self.entries[self._key(media_key)] = (time.time() + ttl, value)
+
+    def invalidate(self, media_key: MediaKey):
+        self.entries.pop(self._key(media_key), None)
+
+    async def get_or_fetch(self, media_key: MediaKey, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(media_key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        async def fetch_and_store():
+            result = await fetch()
+            if result is not None:
+                self.set(media_key, result)
+            return result
+
+        value, _ = await self._in_flight.do(self._key(media_key), fetch_and_store)
+        return value
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as file:
+                entries = pickle.load(file)
+        except Exception as e:
+            logging.warning("Metadata cache was not loaded from %s: %s", self.path, e)
+            return
+        now = time.time()
+        for key, (expires_at, value) in entries.items():
+            if expires_at > now:
+                self.entries[key] = (expires_at, value)
+        logging.info("Loaded %s metadata entries", len(self.entries))
+
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        entries = {}
+        for key, (expires_at, value) in list(self.entries.items()):
+            if expires_at <= now:
+                continue
+            try:
+                pickle.dumps(value)
+            except Exception:
+                # Напр. об'єкти клієнтів із відкритими з'єднаннями; їх просто отримаємо заново
+                continue
+            entries[key] = (expires_at, value)
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump(entries, file)
+        os.replace(temp_path, self.path)
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "maxsize": self.entries.maxsize, "hits": self.hits,
+                "misses": self.misses}
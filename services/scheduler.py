@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class Job:
+    __slots__ = ("platform", "func", "priority", "queued_at", "started", "future")
+
+    def __init__(self, platform: str, func: Callable[[], Awaitable[Any]], priority: float):
+        self.platform = platform
+        self.func = func
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.started = False
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class DownloadScheduler:
+    """Runs download jobs under a global and a per-platform concurrency cap.
+
+    Waiting jobs are ordered by an estimated deadline: the time they were queued plus
+    the time their size would take at ``bytes_per_second``. Small files with a known
+    size therefore overtake large ones, while a large job never waits forever.
+    """
+
+    def __init__(self, global_limit: int, platform_limits: Dict[str, int],
+                 bytes_per_second: int, default_size: int):
+        self.global_limit = global_limit
+        self.platform_limits = platform_limits
+        self.bytes_per_second = bytes_per_second
+        self.default_size = default_size
+
+        self._pending: List[Job] = []
+        self._running = Counter()
+        self._tasks = set()
+
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _can_start(self, job: Job) -> bool:
+        if sum(self._running.values()) >= self.global_limit:
+            return False
+        return self._running[job.platform] < self.platform_limits.get(job.platform, self.global_limit)
+
+    def _dispatch(self):
+        while self._pending:
+            startable = [job for job in self._pending if self._can_start(job)]
+            if not startable:
+                return
+            job = min(startable, key=lambda j: j.priority)
+            self._pending.remove(job)
+            self._start(job)
+
+    def _start(self, job: Job):
+        wait = time.monotonic() - job.queued_at
+        self.started += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+        job.started = True
+        self._running[job.platform] += 1
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: Job):
+        try:
+            result = await job.func()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running[job.platform] -= 1
+            self._dispatch()
+
+    def position(self, job: Job) -> int:
+        return 1 + sum(1 for other in self._pending if other.priority < job.priority)
+
+    async def submit(self, platform: str, func: Callable[[], Awaitable[Any]], size: Optional[int] = None,
+                     on_wait: Optional[Callable[[int], Awaitable[Any]]] = None):
+        """Queue ``func`` and return its result once it has run.
+
+        ``on_wait`` is awaited with the queue position if the job cannot start right away.
+        """
+        priority = time.monotonic() + (size or self.default_size) / self.bytes_per_second
+        job = Job(platform, func, priority)
+        self._pending.append(job)
+        self._dispatch()
+
+        if not job.started and on_wait is not None:
+            try:
+                await on_wait(self.position(job))
+            except Exception as e:
+                logging.warning("Queue notification failed: %s", e)
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            if job in self._pending:
+                self._pending.remove(job)
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._pending),
+            "running": sum(self._running.values()),
+            "started": self.started,
+            "avg_wait": self.total_wait / self.started if self.started else 0.0,
+            "max_wait": self.max_wait,
+        }
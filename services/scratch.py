@@ -0,0 +1,130 @@
+import asyncio
+import glob
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+
+
+class ScratchSpace:
+    """Per-job working directories under ``root`` with a shared disk budget.
+
+    Every job gets its own directory, which is removed with everything in it when the
+    job ends, whether it succeeded or not. Jobs reserve their expected size up front and
+    wait while the running jobs' reservations would go over ``budget``; a job larger than
+    the whole budget still runs once it is alone. A background janitor removes whatever
+    is not owned by a running job: everything at startup, and afterwards anything older
+    than ``orphan_age``.
+    """
+
+    def __init__(self, root: str, budget: int, default_size: int, orphan_age: float,
+                 sweep_interval: float, keep: Iterable[str] = ()):
+        self.root = root
+        self.budget = budget
+        self.default_size = default_size
+        self.orphan_age = orphan_age
+        self.sweep_interval = sweep_interval
+        self.keep = set(keep)
+
+        self.reserved = 0
+        self._active = set()
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+        self.jobs = 0
+        self.waited = 0
+        self.removed = 0
+
+    @asynccontextmanager
+    async def reserve(self, size: Optional[int] = None):
+        """Hold ``size`` bytes of the budget (waiting for them first) while the block runs.
+
+        For writes that live outside a job directory, such as the media store.
+        """
+        size = size or self.default_size
+        async with self._changed:
+            if self.reserved and self.reserved + size > self.budget:
+                self.waited += 1
+            await self._changed.wait_for(lambda: not self.reserved or self.reserved + size <= self.budget)
+            self.reserved += size
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self.reserved -= size
+                self._changed.notify_all()
+
+    @asynccontextmanager
+    async def job(self, name: str, size: Optional[int] = None):
+        """Yield a fresh directory for one job, waiting for disk budget first."""
+        async with self.reserve(size):
+            self.jobs += 1
+            os.makedirs(self.root, exist_ok=True)
+            path = tempfile.mkdtemp(prefix=f"{name}_", dir=self.root)
+            self._active.add(path)
+            try:
+                yield path
+            finally:
+                await asyncio.to_thread(shutil.rmtree, path, True)
+                self._active.discard(path)
+
+    def sweep(self, max_age: float = 0.0):
+        """Remove entries of ``root`` that no running job owns and that are older than ``max_age``."""
+        if not os.path.isdir(self.root):
+            return
+        now = time.time()
+        for entry in os.scandir(self.root):
+            if entry.name in self.keep or entry.path in self._active:
+                continue
+            try:
+                if now - entry.stat(follow_symlinks=False).st_mtime < max_age:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+                self.removed += 1
+            except OSError as e:
+                logging.warning("Could not remove %s: %s", entry.path, e)
+
+    def _sweep_legacy(self):
+        # Раніше Instagram писав у downloads.{shortcode} поруч із root
+        for path in glob.glob(f"{glob.escape(self.root)}.*"):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+                self.removed += 1
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # Після перезапуску жодна задача ще не працює, тож усе в root - залишки
+        try:
+            await asyncio.to_thread(self._sweep_legacy)
+            await asyncio.to_thread(self.sweep)
+            logging.info("Scratch space swept, %s orphans removed", self.removed)
+        except Exception as e:
+            logging.error("Scratch space sweep failed: %s", e)
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep, self.orphan_age)
+            except Exception as e:
+                logging.error("Scratch space sweep failed: %s", e)
+
+    def stats(self) -> dict:
+        return {"reserved": self.reserved, "budget": self.budget, "active": len(self._active),
+                "jobs": self.jobs, "waited": self.waited, "removed": self.removed}
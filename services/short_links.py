@@ -0,0 +1,95 @@
+import logging
+from datetime import timedelta
+from typing import Optional
+from urllib.parse import urljoin
+
+import httpx
+from cachetools import TTLCache
+
+from services import http
+from services.db import DataBase
+from services.media_key import resolve_media_key
+from services.singleflight import SingleFlight
+
+
+class ShortLinkResolver:
+    """Expands short links (vm.tiktok.com, t.co, ...) to the url that names the media.
+
+    Redirects are followed one hop at a time, and the walk stops at the first location
+    ``resolve_media_key`` understands, so the hops after it (consent and login pages,
+    regional mirrors) are never requested. A short link points to the same media for
+    everyone, so targets are kept in an LRU + TTL cache and in the ``short_links`` table.
+    """
+
+    def __init__(self, db: DataBase, maxsize: int, ttl: int, max_redirects: int):
+        self.db = db
+        self.ttl = timedelta(seconds=ttl)
+        self.max_redirects = max_redirects
+        self.targets = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight = SingleFlight()
+
+        self.hits = 0
+        self.stored = 0
+        self.resolved = 0
+
+    @staticmethod
+    def _normalize(url: str) -> str:
+        url = url.strip()
+        return url if "://" in url else "https://" + url
+
+    async def expand(self, url: str, **kwargs) -> str:
+        """Return the target of ``url``, or ``url`` itself if it could not be resolved.
+
+        ``kwargs`` (e.g. headers) are passed to every request of the redirect walk.
+        """
+        url = self._normalize(url)
+        target = self.targets.get(url)
+        if target is not None:
+            self.hits += 1
+            return target
+
+        target, _ = await self._in_flight.do(url, lambda: self._lookup(url, **kwargs))
+        return target or url
+
+    async def _lookup(self, url: str, **kwargs) -> Optional[str]:
+        try:
+            target = await self.db.get_short_link(url, self.ttl)
+        except Exception as e:
+            logging.warning("Short link lookup failed for %s: %s", url, e)
+            target = None
+        if target is not None:
+            self.stored += 1
+            self.targets[url] = target
+            return target
+
+        try:
+            target = await self._follow(url, **kwargs)
+        except httpx.HTTPError as e:
+            logging.warning("Could not expand %s: %s", url, e)
+            return None
+        self.resolved += 1
+        # Кешуємо лише цілі з id медіа; сторінки згоди чи капчі можуть наступного разу вести далі
+        if resolve_media_key(target) is None:
+            return target
+        self.targets[url] = target
+
+        try:
+            await self.db.save_short_link(url, target)
+        except Exception as e:
+            logging.warning("Short link %s was not saved: %s", url, e)
+        return target
+
+    async def _follow(self, url: str, **kwargs) -> str:
+        for _ in range(self.max_redirects):
+            response = await http.fetch(url, method="HEAD", follow_redirects=False, **kwargs)
+            location = response.headers.get("Location")
+            if not response.is_redirect or not location:
+                response.raise_for_status()
+                return str(response.url)
+            url = urljoin(str(response.url), location)
+            if resolve_media_key(url) is not None:
+                return url
+        return url
+
+    def stats(self) -> dict:
+        return {"size": len(self.targets), "hits": self.hits, "stored": self.stored, "resolved": self.resolved}
@@ -0,0 +1,91 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, BinaryIO, Optional
+
+from aiogram.types import InputFile
+
+import config
+from services import http
+from services.media_probe import VideoInfo, mdat_before_moov, probe_mp4_header
+
+
+class StreamInputFile(InputFile):
+    """Upload body fed from an open download: the bytes go to Telegram without touching the disk.
+
+    It can only be read once, so it must not be reused for a second request. With ``sink``
+    set, every chunk is also written there, keeping a local copy without a second download.
+    """
+
+    def __init__(self, head: bytes, chunks: AsyncIterator[bytes], filename: str, max_size: Optional[int] = None,
+                 sink: Optional[BinaryIO] = None):
+        super().__init__(filename=filename, chunk_size=config.STREAM_CHUNK_SIZE)
+        self.head = head
+        self.chunks = chunks
+        self.max_size = max_size
+        self.sink = sink
+        self._consumed = False
+
+    async def read(self, bot):
+        if self._consumed:
+            raise RuntimeError(f"{self.filename} was already uploaded")
+        self._consumed = True
+
+        sent = len(self.head)
+        if self.head:
+            if self.sink is not None:
+                self.sink.write(self.head)
+            yield self.head
+        async for chunk in self.chunks:
+            sent += len(chunk)
+            if self.max_size is not None and sent > self.max_size:
+                raise ValueError(f"{self.filename} is larger than {self.max_size} bytes")
+            if self.sink is not None:
+                self.sink.write(chunk)
+            yield chunk
+
+
+class MediaStream:
+    """An open download with the first bytes already read.
+
+    ``info`` is the video size and duration if the MP4 header was within the buffered prefix.
+    """
+
+    def __init__(self, head: bytes, chunks: AsyncIterator[bytes], size: Optional[int], info: Optional[VideoInfo]):
+        self.head = head
+        self.chunks = chunks
+        self.size = size
+        self.info = info
+
+    def input_file(self, filename: str, max_size: Optional[int] = None,
+                   sink: Optional[BinaryIO] = None) -> StreamInputFile:
+        return StreamInputFile(self.head, self.chunks, filename, max_size, sink)
+
+    async def spool(self, path: str):
+        """Write the whole body to ``path``, for when a seekable file is really needed."""
+        with open(path, "wb") as file:
+            file.write(self.head)
+            async for chunk in self.chunks:
+                file.write(chunk)
+
+
+@asynccontextmanager
+async def open_media(url: str, probe: bool = True, **kwargs):
+    """Open ``url`` and buffer only as much as is needed to read the MP4 header.
+
+    Nothing is buffered past ``STREAM_HEADER_LIMIT``, and reading stops early once mdat
+    turns out to come first (the header is then at the end of the file).
+    """
+    async with http.stream(url, **kwargs) as response:
+        response.raise_for_status()
+        size = int(response.headers["Content-Length"]) if "Content-Length" in response.headers else None
+        chunks = response.aiter_bytes(config.STREAM_CHUNK_SIZE)
+
+        head = bytearray()
+        info = None
+        if probe:
+            async for chunk in chunks:
+                head += chunk
+                info = probe_mp4_header(head)
+                if info is not None or mdat_before_moov(head) or len(head) >= config.STREAM_HEADER_LIMIT:
+                    break
+
+        yield MediaStream(bytes(head), chunks, size, info)
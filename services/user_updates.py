@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from services.db import DataBase, UserProfile
+
+
+class UserUpdateBuffer:
+    """Write-behind buffer for user upserts.
+
+    Updates are coalesced per user in memory (the latest name wins) and written by a
+    background task as one multi-row upsert. Users whose cached profile already matches
+    are not queued at all.
+    """
+
+    def __init__(self, db: DataBase, flush_interval: float, batch_size: int):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._pending: Dict[int, Tuple[int, Optional[str], Optional[str]]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.skipped = 0
+        self.written = 0
+
+    def record(self, user_id, user_name, user_username, profile: UserProfile):
+        user_id = int(user_id)
+        if (profile.exists and profile.status == 'active'
+                and (profile.user_name, profile.user_username) == (user_name, user_username)):
+            self.skipped += 1
+            return
+        self._pending[user_id] = (user_id, user_name, user_username)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = list(self._pending.values()), {}
+        try:
+            await self.db.upsert_users(rows)
+            self.written += len(rows)
+        except Exception as e:
+            logging.warning("User updates were not written: %s", e)
+            # Повертаємо в чергу, якщо за цей час не прийшло новіших даних
+            for row in rows:
+                self._pending.setdefault(row[0], row)